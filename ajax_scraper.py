@@ -4,17 +4,159 @@ Uses the actual AJAX endpoints found during analysis
 """
 
 import requests
-from bs4 import BeautifulSoup
 import re
 import time
-import pandas as pd
 import logging
 import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from html_extractor import extract_html_records
+from structured_log import LookupTrace, configure_logging, log_sampler
+from normalization import account_type_name, account_status_name, intern_value, normalize_pan_details
+
+# pandas, BeautifulSoup, asyncio and aiohttp (async API only) are imported where they are used so that
+# startup (single lookups, --help) does not pay for them
+
+# Phrases the portal uses when a PAN has no record
+NO_RECORD_PATTERN = re.compile(
+    r"no\s+(?:record|data|result)s?\s+found|record\s+not\s+found|pan\s+does\s+not\s+exist",
+    re.IGNORECASE
+)
+
+# Fast paths for the search page so a lookup only builds a soup when these miss
+TOKEN_PATTERN = re.compile(
+    r"<input[^>]*?name=[\"']_token[\"'][^>]*?value=[\"']([^\"']+)|<input[^>]*?value=[\"']([^\"']+)[\"'][^>]*?name=[\"']_token[\"']",
+    re.IGNORECASE
+)
+CAPTCHA_PATTERN = re.compile(r'What is\s*\d+\s*[\+\-\*/]\s*\d+', re.IGNORECASE)
+
+DEFAULT_BASE_URL = "https://ird.gov.np"
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# Multi-PAN request shapes tried against the statistics endpoint: (field, PANs as 'comma' string or 'list', encoding)
+BULK_PAYLOADS = [
+    ('pan', 'comma', 'json'),
+    ('pans', 'list', 'json'),
+    ('pan[]', 'list', 'form'),
+    ('pan', 'comma', 'form'),
+]
+BULK_SECTIONS = ('panDetails', 'panRegistrationDetail', 'panTaxClearance')
+
+MAX_SESSION_COOKIES = 50
+
+# A prefetched token/captcha older than this is discarded and fetched again
+TICKET_TTL = 60
+
+# Statuses that count against the proxy a request went through: per-address throttling and gateway errors
+EGRESS_ERROR_STATUSES = (429, 502, 504)
+
+# Why a lookup failed (result['reason'] on every failed result) and how outputs describe it
+FAILURE_REASONS = {
+    'no_record': "No record exists",
+    'no_data': "No data found",
+    'csrf_token': "Could not get CSRF token",
+    'captcha': "Could not solve captcha",
+    'session_rejected': "Session rejected by portal",
+    'throttled': "Session throttled by portal",
+    'timeout': "Portal timed out",
+    'portal_unavailable': "IRD portal unavailable",
+    'error': "Lookup error",
+}
+# Failures another attempt on a fresh session can fix; no_record and no_data are the portal's answer about the PAN
+TRANSIENT_REASONS = frozenset(FAILURE_REASONS) - {'no_record', 'no_data'}
+
+# Lookup POST statuses meaning the portal refused the session (419: Laravel's expired CSRF token)
+SESSION_REJECTED_STATUSES = (401, 403, 419)
+
+# Async API: lookups in flight at once (lookup_many) and connections they share
+ASYNC_CONCURRENCY = 100
+ASYNC_CONNECTIONS = 100
+
+
+def failure_reason(result):
+    """Text describing why a failed result failed, for outputs"""
+    reason = result.get('reason') or ('no_record' if result.get('not_found') else 'no_data')
+    return FAILURE_REASONS.get(reason, reason)
+
+
+def is_transient_failure(result):
+    """Whether a failed lookup is worth repeating on a fresh session"""
+    return not result.get('success') and result.get('reason') in TRANSIENT_REASONS
+
+
+def is_evaluated_payload(payload):
+    """Whether the portal can have evaluated a lookup request: the form's own field plus captcha and
+    token. Only a no-record answer to such a request is definitive; guessed variants may be ignored"""
+    return bool(payload and payload.get('pan') and payload.get('captcha') and payload.get('_token'))
+
+
+def note_response(issues, response):
+    """Remember in `issues` why a lookup response could not be used"""
+    if response.status_code in SESSION_REJECTED_STATUSES:
+        issues.add('session_rejected')
+
+
+def note_error(issues, error):
+    """Remember in `issues` why a lookup request failed"""
+    if isinstance(error, requests.Timeout):
+        issues.add('timeout')
+    elif isinstance(error, requests.RequestException):
+        issues.add('portal_unavailable')
+
+
+def miss_reason(issues):
+    """Reason for a lookup that got no usable answer: the worst problem met, else the portal had no data"""
+    for reason in ('timeout', 'portal_unavailable', 'session_rejected'):
+        if reason in issues:
+            return reason
+    return 'no_data'
+
+
+class FetchedResponse:
+    """A response read in full by the async client, with the parts of requests.Response the parsers use"""
+
+    def __init__(self, status_code, content, encoding=None):
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        pass
+
+def make_soup(content):
+    """Parse HTML, importing BeautifulSoup on first use"""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, 'html.parser')
+
+class LookupTicket:
+    """A CSRF token and solved captcha, fetched on a session ahead of the lookup that uses them"""
+
+    def __init__(self, session, token, captcha_answer, error):
+        self.session = session
+        self.token = token
+        self.captcha_answer = captcha_answer
+        self.error = error
+        self.created = time.time()
+
+    def is_usable(self):
+        return not self.error and time.time() - self.created < TICKET_TTL
 
 class AjaxPANScraper:
-    def __init__(self):
-        self.base_url = "https://ird.gov.np"
-        self.search_url = "https://ird.gov.np/pan-search"
+    def __init__(self, cache=None, breaker=None, timeout=30, user_agent=DEFAULT_USER_AGENT, recorder=None,
+                 canonicalize=False, rate_limiter=None, egress_pool=None, base_url=DEFAULT_BASE_URL,
+                 pipeline=False, hedging=None, profiler=None):
+        # base_url can point at a local mock portal (soak_test.py)
+        self.base_url = base_url.rstrip('/')
+        self.search_url = self.base_url + "/pan-search"
         self.session = requests.Session()
         
         # Discovered AJAX endpoints
@@ -24,43 +166,348 @@ class AjaxPANScraper:
             'pan_tax_clearance': '/panTaxClearance',
             'pan_stats': '/statstics/getPanSearch'
         }
-        
-        self.setup_logging()
-        self.setup_session()
-        
-    def setup_logging(self):
-        logging.basicConfig(level=logging.INFO, 
-                          format='%(asctime)s - %(levelname)s - %(message)s')
+
+        # Optional ResultCache; known-invalid PANs are answered from it without any request
+        self.cache = cache
+
+        # Circuit breaker around all portal traffic; it opens when ird.gov.np is down
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = timeout
+
+        # Optional RateLimiter shared with other sessions; every request waits for its slot
+        self.rate_limiter = rate_limiter
+
+        # Responses that look like server-side throttling (HTTP 429) seen by this session
+        self.throttled = 0
+        self.requests_sent = 0
+        self.counter_lock = threading.Lock()
+
+        # Index into BULK_PAYLOADS that the statistics endpoint answered, False once it is known not to
+        self.bulk_payload = None
+
+        self.user_agent = user_agent
+
+        # Optional ResponseRecorder (replay.py) that archives lookup responses for offline re-parsing
+        self.recorder = recorder
+        self.current_pan = None
+
+        # Map office and city spellings to canonical names (repeated values are always interned)
+        self.canonicalize = canonicalize
+
+        # Optional EgressPool of proxies; the session sticks to one egress unless the pool rotates per request
+        self.egress_pool = egress_pool
+        self.egress = None
+
+        # Cookies the portal sets accumulate in the jar; it is cleared beyond this many (tokens are fetched per lookup)
+        self.max_cookies = MAX_SESSION_COOKIES
+
+        # Pipelining: the token and captcha for the next lookup are fetched on a second session (its own
+        # cookies, so its captcha cannot invalidate the one in use) while the current lookup's POSTs run
+        self.pipeline = pipeline
+        self.spare_session = requests.Session() if pipeline else None
+        self.prefetcher = None
+        self.next_ticket = None
+
+        # Async API: connections shared by every async lookup, created in the loop that first uses them
+        self.connector = None
+        self.connector_loop = None
+        self.max_connections = ASYNC_CONNECTIONS
+
+        # Optional HedgePolicy shared with other sessions: a lookup POST slower than the recent p95 gets a
+        # duplicate on another pooled connection of the same session (same cookies, so the captcha stays valid)
+        self.hedging = hedging
+        self.hedger = None
+
+        # Optional RunProfiler (profiling.py); lookups and prefetches run under it when set
+        self.profiler = profiler
+
+        # Logging is configured once by the entry point (structured_log.configure_logging), not per instance
         self.logger = logging.getLogger(__name__)
+        for session in self.http_sessions():
+            self.setup_session(session)
+        if egress_pool and not egress_pool.per_request:
+            self.use_egress(egress_pool.assign())
     
-    def setup_session(self):
+    def http_sessions(self):
+        return [session for session in (self.session, self.spare_session) if session]
+
+    def setup_session(self, session):
         """Setup session with realistic headers"""
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        session.headers.update(self.default_headers())
+
+    def default_headers(self):
+        return {
+            'User-Agent': self.user_agent,
             'Accept': 'application/json, text/javascript, */*; q=0.01',
             'Accept-Language': 'en-US,en;q=0.9',
             'Accept-Encoding': 'gzip, deflate, br',
             'DNT': '1',
             'Connection': 'keep-alive',
             'X-Requested-With': 'XMLHttpRequest',
-        })
+        }
     
-    def get_csrf_token(self):
+    def use_egress(self, egress):
+        self.egress = egress
+        for session in self.http_sessions():
+            session.proxies = egress.proxies
+
+    def switch_egress(self):
+        """Move off a dropped egress; the new route starts with fresh cookies"""
+        previous = self.egress
+        self.use_egress(self.egress_pool.assign(previous=previous))
+        for session in self.http_sessions():
+            session.cookies.clear()
+        self.logger.info("Egress %s dropped, switched to %s", previous.url, self.egress.url or 'direct')
+
+    def close(self):
+        """Release the sessions, the prefetch and hedge threads and the egress slot"""
+        for executor in (self.prefetcher, self.hedger):
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self.prefetcher = self.hedger = None
+        self.next_ticket = None
+        if self.egress_pool and self.egress:
+            self.egress_pool.release(self.egress)
+            self.egress = None
+        for session in self.http_sessions():
+            session.close()
+
+    def warm_up(self):
+        """Open connections (and TLS) before a batch starts; with pipelining also fetches the first ticket"""
+        try:
+            self.send('GET', self.search_url)
+        except (CircuitOpenError, requests.RequestException) as e:
+            self.logger.warning("Warm-up request failed: %s", e)
+        self.start_prefetch()
+
+    def start_prefetch(self):
+        """Fetch the next lookup's token and captcha in the background on the spare session"""
+        if not self.pipeline or self.next_ticket:
+            return
+        if self.prefetcher is None:
+            self.prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ticket-prefetch')
+        if self.profiler:
+            self.next_ticket = self.prefetcher.submit(self.profiler.run, 'prefetch', self.fetch_ticket,
+                                                      self.spare_session)
+        else:
+            self.next_ticket = self.prefetcher.submit(self.fetch_ticket, self.spare_session)
+
+    def fetch_ticket(self, session):
+        # A jar is only cleared here, right before its session fetches a new token and captcha; clearing it
+        # anywhere else could drop the cookies a prefetched (or in-use) captcha depends on
+        if len(session.cookies) > self.max_cookies:
+            session.cookies.clear()
+        token, captcha_answer, error = self.prepare_lookup(session)
+        return LookupTicket(session, token, captcha_answer, error)
+
+    def take_ticket(self):
+        """Token and captcha for the lookup about to run: the prefetched ones if still usable, else fetched now"""
+        future, self.next_ticket = self.next_ticket, None
+        ticket = None
+        if future:
+            try:
+                ticket = future.result()
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                self.logger.debug("Prefetch failed: %s", e)
+        if ticket is None or not ticket.is_usable():
+            ticket = self.fetch_ticket(self.session)
+        elif ticket.session is not self.session:
+            # The lookup runs on the session that holds the ticket's cookies; the other one prefetches next
+            self.session, self.spare_session = ticket.session, self.session
+        self.start_prefetch()
+        return ticket
+
+    def send(self, method, url, session=None, record=True, **kwargs):
+        """Send a request to the portal through the circuit breaker, on this scraper's session unless given one"""
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"IRD portal unavailable ({self.breaker.describe()})")
+
+        kwargs.setdefault('timeout', self.timeout)
+        if self.egress and not self.egress.is_available():
+            self.switch_egress()
+        egress = self.egress
+        if self.egress_pool and self.egress_pool.per_request:
+            egress = self.egress_pool.next_egress()
+            kwargs['proxies'] = egress.proxies
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        with self.counter_lock:
+            self.requests_sent += 1
+        started = time.perf_counter()
+        try:
+            response = (session or self.session).request(method, url, **kwargs)
+        except requests.exceptions.ProxyError:
+            # The proxy failed, not the portal: only the egress is blamed
+            if egress:
+                self.egress_pool.record(egress, time.perf_counter() - started, False)
+            raise
+        except requests.RequestException:
+            if egress:
+                self.egress_pool.record(egress, time.perf_counter() - started, False)
+            self.breaker.record_failure()
+            raise
+
+        if record and self.recorder and method == 'POST' and self.current_pan:
+            self.recorder.record(self.current_pan, method, url, kwargs, response)
+
+        if egress:
+            self.egress_pool.record(egress, time.perf_counter() - started, response.status_code not in EGRESS_ERROR_STATUSES)
+        self.record_status(response.status_code)
+        return response
+
+    def record_status(self, status_code):
+        """Count throttling and feed the circuit breaker from a response status"""
+        if status_code == 429:
+            with self.counter_lock:
+                self.throttled += 1
+        # 5xx means the portal itself is failing (maintenance pages come back as 503)
+        if status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def run_steps(self, steps, session=None):
+        """Drive a step generator (the *_steps methods) with blocking requests
+
+        Each (method, url, kwargs) the generator yields is sent, lookup POSTs through post()
+        so they can be hedged, and the response (or the exception raised) is passed back in;
+        returns what the generator returns
+        """
+        outcome, failed = None, False
+        while True:
+            try:
+                method, url, kwargs = steps.throw(outcome) if failed else steps.send(outcome)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                if method == 'POST':
+                    outcome = self.post(url, session=session, **kwargs)
+                else:
+                    outcome = self.send(method, url, session=session, **kwargs)
+                failed = False
+            except Exception as e:
+                outcome, failed = e, True
+
+    def post(self, url, **kwargs):
+        """A lookup POST, hedged when a HedgePolicy is set"""
+        if not (self.hedging and self.hedging.budget):
+            return self.send('POST', url, **kwargs)
+        delay = self.hedging.delay()
+        if delay is None:
+            started = time.perf_counter()
+            response = self.send('POST', url, **kwargs)
+            self.hedging.record_latency(time.perf_counter() - started)
+            return response
+
+        if self.hedger is None:
+            self.hedger = ThreadPoolExecutor(max_workers=4, thread_name_prefix='hedge')
+        # Only the answer that is used gets recorded, under the PAN it belongs to (a loser can finish late)
+        pan_number = self.current_pan
+        started = time.perf_counter()
+        primary = self.hedger.submit(self.send, 'POST', url, record=False, **kwargs)
+        primary.add_done_callback(
+            lambda f: f.cancelled() or self.hedging.record_latency(time.perf_counter() - started))
+        try:
+            return self.record_answer(pan_number, url, kwargs, primary.result(timeout=delay))
+        except FutureTimeoutError:
+            pass
+        if not self.hedging.try_hedge():
+            return self.record_answer(pan_number, url, kwargs, primary.result())
+
+        self.logger.debug("POST %s slower than %.0f ms, hedging", url, delay * 1000)
+        hedge = self.hedger.submit(self.send, 'POST', url, record=False, **kwargs)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            good = [f for f in (primary, hedge) if f in done and self.is_good_answer(f)]
+            if good or not pending:
+                break
+        # With no good answer from either, the original request's outcome stands
+        winner = good[0] if good else primary
+        if winner is hedge:
+            self.hedging.record_win()
+        self.discard_loser(pending, saving=winner is hedge)
+        return self.record_answer(pan_number, url, kwargs, winner.result())
+
+    def is_good_answer(self, future):
+        if future.exception():
+            return False
+        status = future.result().status_code
+        return status < 500 and status != 429
+
+    def discard_loser(self, pending, saving):
+        """The slower request is cancelled if it has not started, otherwise dropped when it returns"""
+        answered = time.perf_counter()
+        for future in pending:
+            if future.cancel():
+                continue
+
+            def drop(f):
+                if f.cancelled() or f.exception():
+                    return
+                f.result().close()
+                if saving:
+                    self.hedging.record_saving(time.perf_counter() - answered)
+            future.add_done_callback(drop)
+
+    def record_answer(self, pan_number, url, kwargs, response):
+        if self.recorder and pan_number:
+            self.recorder.record(pan_number, 'POST', url, kwargs, response)
+        return response
+
+    def wait_for_portal(self, should_continue=None, on_wait=None):
+        """Block while the circuit is open, probing the portal whenever a half-open window comes up"""
+        while self.breaker.state != CircuitBreaker.CLOSED:
+            delay = self.breaker.seconds_until_probe()
+            if on_wait:
+                on_wait(self.breaker, delay)
+
+            deadline = time.time() + delay
+            while time.time() < deadline:
+                if should_continue and not should_continue():
+                    return False
+                time.sleep(min(1, max(0, deadline - time.time())))
+
+            try:
+                self.send('GET', self.search_url)
+                self.logger.info("Portal probe finished, %s", self.breaker.describe())
+            except (CircuitOpenError, requests.RequestException) as e:
+                suppressed = log_sampler.allow('probe-failed')
+                if suppressed is not None:
+                    self.logger.warning("Portal probe failed: %s (%d similar suppressed)", e, suppressed)
+        return True
+
+    def get_csrf_token(self, session=None):
         """Get CSRF token from the main page"""
+        return self.run_steps(self.csrf_token_steps(), session)
+
+    def csrf_token_steps(self):
         try:
-            response = self.session.get(self.search_url)
-            soup = BeautifulSoup(response.content, 'html.parser')
+            response = yield 'GET', self.search_url, {}
+            
+            match = TOKEN_PATTERN.search(response.text)
+            if match:
+                token = match.group(1) or match.group(2)
+                self.logger.debug("Found CSRF token: %.20s...", token)
+                return token
             
             # Find CSRF token
+            soup = make_soup(response.content)
             token_input = soup.find('input', {'name': '_token'})
             if token_input:
                 token = token_input.get('value')
-                self.logger.info(f"Found CSRF token: {token[:20]}...")
+                self.logger.debug("Found CSRF token: %.20s...", token)
                 return token
             
             return None
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error getting CSRF token: {e}")
+            suppressed = log_sampler.allow('csrf-error')
+            if suppressed is not None:
+                self.logger.error("Error getting CSRF token: %s (%d similar suppressed)", e, suppressed)
             return None
     
     def solve_captcha(self, captcha_text):
@@ -82,51 +529,409 @@ class AjaxPANScraper:
                 if match:
                     num1, num2 = int(match.group(1)), int(match.group(2))
                     result = operation(num1, num2)
-                    self.logger.info(f"Solved captcha: {text} = {result}")
+                    self.logger.debug("Solved captcha: %s = %s", text, result)
                     return str(result)
             return None
         except Exception as e:
-            self.logger.error(f"Error solving captcha: {e}")
+            self.logger.error("Error solving captcha: %s", e)
             return None
     
     def search_pan_ajax(self, pan_number):
         """Search using AJAX endpoints"""
+        if self.profiler:
+            return self.profiler.run('lookup', self.traced_lookup, pan_number)
+        return self.traced_lookup(pan_number)
+
+    def traced_lookup(self, pan_number):
+        trace = LookupTrace(pan_number, self.requests_sent)
+        result = self.run_lookup(pan_number, trace)
+        trace.emit(result, self.requests_sent)
+        return result
+    
+    def run_lookup(self, pan_number, trace):
+        """The lookup ladder behind search_pan_ajax; phases are timed on the trace"""
         try:
-            self.logger.info(f"Starting AJAX search for PAN: {pan_number}")
-            
-            # Step 1: Get initial page and CSRF token
-            token = self.get_csrf_token()
-            if not token:
-                return {'success': False, 'message': 'Could not get CSRF token'}
-            
-            # Step 2: Get captcha and solve it
-            response = self.session.get(self.search_url)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Find captcha
-            captcha_text = self.find_captcha(soup)
-            if not captcha_text:
-                return {'success': False, 'message': 'Could not find captcha'}
+            self.logger.debug("Starting AJAX search for PAN: %s", pan_number)
+            self.current_pan = pan_number
+
+            cached = self.cached_result(pan_number, trace)
+            if cached:
+                return cached
+
+            # Steps 1-2: CSRF token and solved captcha, usually prefetched while the previous lookup ran
+            ticket = self.take_ticket()
+            trace.phase('prepare')
+            result = self.run_steps(self.lookup_steps(pan_number, ticket.token, ticket.captcha_answer, ticket.error,
+                                                      trace))
+            self.cache_outcome(pan_number, result)
+            return result
+        except CircuitOpenError as e:
+            return self.circuit_open_result(pan_number, e)
+        except Exception as e:
+            return self.error_result(pan_number, e)
+        finally:
+            if self.recorder:
+                self.recorder.flush(pan_number)
+
+    def cached_result(self, pan_number, trace):
+        if not self.cache:
+            return None
+        cached = self.cache.get_result(pan_number)
+        trace.phase('cache')
+        if cached:
+            self.logger.debug("PAN %s answered from cache", pan_number)
+        return cached
+
+    def circuit_open_result(self, pan_number, error):
+        suppressed = log_sampler.allow('circuit-open')
+        if suppressed is not None:
+            self.logger.warning("PAN %s not searched: %s (%d similar suppressed)", pan_number, error, suppressed)
+        return {'success': False, 'retry': True, 'reason': 'portal_unavailable', 'message': str(error)}
+
+    def error_result(self, pan_number, error):
+        self.logger.error("AJAX search for PAN %s failed: %s", pan_number, error)
+        return {'success': False, 'reason': 'error', 'message': str(error)}
+
+    def lookup_steps(self, pan_number, token, captcha_answer, error, trace):
+        """Steps 3-4 of a lookup, once the token and captcha are known (see run_steps)"""
+        # Problems met on the way, so a miss can say why it failed
+        issues = set()
+        if error:
+            return self.classify_result({'success': False, 'reason': error, 'message': FAILURE_REASONS[error]})
+
+        # Endpoints whose only no-record answers came from guessed payloads
+        no_record_hints = 0
+
+        # Step 3: Try each AJAX endpoint
+        for endpoint_name, endpoint_path in self.ajax_endpoints.items():
+            self.logger.debug("Trying AJAX endpoint: %s (%s)", endpoint_name, endpoint_path)
+
+            result = yield from self.ajax_endpoint_steps(endpoint_path, pan_number, captcha_answer, token, issues)
+            trace.phase(endpoint_name)
+            if result['success']:
+                self.logger.debug("Success with endpoint: %s", endpoint_name)
+                result['endpoint'] = endpoint_name
+                return self.classify_result(result, issues)
+            if result.get('not_found'):
+                self.logger.debug("Endpoint %s reported no record for PAN %s", endpoint_name, pan_number)
+                return self.classify_result(result, issues)
+            if result.get('no_record_hint'):
+                no_record_hints += 1
+
+        # Step 4: Try the discovered submission method
+        result = yield from self.discovered_method_steps(pan_number, captcha_answer, token, issues)
+        trace.phase('discovered_method')
+        if result['success']:
+            result['endpoint'] = 'discovered_method'
+        elif not result.get('not_found') and no_record_hints:
+            # Not definitive (and not cached): a valid PAN may have been sent in a shape the endpoint ignores
+            self.logger.debug("Only guessed payloads reported no record for PAN %s", pan_number)
+            result['message'] = "No data found (only unverified requests reported no record)"
+        return self.classify_result(result, issues)
+
+    async def lookup(self, pan_number):
+        """Search one PAN without blocking the event loop; returns the same result as search_pan_ajax
+
+        Each lookup gets its own cookie jar (the portal ties the captcha to its session) on
+        connections shared by all async lookups, so any number of them can run at once.
+        Cache and recorder file I/O runs in the loop's default executor
+        """
+        import asyncio
+
+        self.check_async_egress()
+        loop = asyncio.get_running_loop()
+        trace = LookupTrace(pan_number, 0)
+        requests_sent = 0
+        try:
+            result = await loop.run_in_executor(None, self.cached_result, pan_number, trace)
+            if not result:
+                async with self.async_session() as session:
+                    result, requests_sent = await self.run_steps_async(
+                        self.full_lookup_steps(pan_number, trace), session, pan_number)
+                await loop.run_in_executor(None, self.cache_outcome, pan_number, result)
+        except CircuitOpenError as e:
+            result = self.circuit_open_result(pan_number, e)
+        except Exception as e:
+            result = self.error_result(pan_number, e)
+        finally:
+            if self.recorder:
+                await loop.run_in_executor(None, self.recorder.flush, pan_number)
+        trace.emit(result, requests_sent)
+        return result
+
+    async def lookup_many(self, pan_numbers, concurrency=ASYNC_CONCURRENCY):
+        """Look up PANs with up to `concurrency` lookups in flight; yields (pan, result) as they finish
+
+        PANs are taken from the iterable as lookups finish, so it can be a lazy stream
+        """
+        import asyncio
+
+        self.check_async_egress()
+        pans = iter(pan_numbers)
+        running = {}
+        try:
+            while True:
+                while len(running) < concurrency:
+                    pan_number = next(pans, None)
+                    if pan_number is None:
+                        break
+                    pan_number = str(pan_number).strip()
+                    running[asyncio.ensure_future(self.lookup(pan_number))] = pan_number
+                if not running:
+                    return
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield running.pop(task), task.result()
+        finally:
+            # The caller stopped iterating (or was cancelled): drop the lookups still in flight
+            for task in running:
+                task.cancel()
+
+    def check_async_egress(self):
+        """Async lookups go out directly; a scraper configured with proxies must not send them"""
+        if self.egress_pool:
+            raise RuntimeError("Async lookups do not go through the egress pool; use the blocking "
+                               "search_pan_ajax for proxied traffic, or a scraper without egress_pool")
+
+    def full_lookup_steps(self, pan_number, trace):
+        token, captcha_answer, error = yield from self.prepare_steps()
+        trace.phase('prepare')
+        return (yield from self.lookup_steps(pan_number, token, captcha_answer, error, trace))
+
+    def async_session(self):
+        """An aiohttp session with its own cookie jar, on the connections shared by async lookups"""
+        import asyncio
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self.connector and not self.connector.closed and self.connector_loop is not loop:
+            # Its sockets belong to the other loop, and replacing it would leak them
+            raise RuntimeError("Async lookups are bound to the event loop that started them; "
+                               "await aclose() on that loop (or use `async with`) before using the scraper on another")
+        if self.connector is None or self.connector.closed:
+            self.connector = aiohttp.TCPConnector(limit=self.max_connections)
+            self.connector_loop = loop
+        headers = self.default_headers()
+        # aiohttp only decodes Brotli with the optional brotli package installed
+        headers['Accept-Encoding'] = 'gzip, deflate'
+        # unsafe: keep cookies from IP-address hosts too (a local mock portal)
+        return aiohttp.ClientSession(connector=self.connector, connector_owner=False, headers=headers,
+                                     cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+    async def send_async(self, session, method, url, pan_number=None, **kwargs):
+        """send() for the async API: one request through the circuit breaker and rate limit, read in full"""
+        import asyncio
+        import aiohttp
+
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"IRD portal unavailable ({self.breaker.describe()})")
+        if self.rate_limiter:
+            delay = self.rate_limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        with self.counter_lock:
+            self.requests_sent += 1
+
+        timeout = aiohttp.ClientTimeout(total=kwargs.pop('timeout', self.timeout))
+        # The step generators and parsers only know requests, so client errors are reported as its exceptions
+        try:
+            async with session.request(method, url, timeout=timeout, **kwargs) as raw:
+                response = FetchedResponse(raw.status, await raw.read(), raw.charset)
+        except asyncio.TimeoutError as e:
+            self.breaker.record_failure()
+            raise requests.Timeout(f"{method} {url} timed out") from e
+        except aiohttp.ClientError as e:
+            self.breaker.record_failure()
+            raise requests.ConnectionError(str(e)) from e
+
+        if self.recorder and method == 'POST' and pan_number:
+            # The recorder's lock is held while it writes a finished lookup to disk
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.recorder.record, pan_number, method, url, kwargs, response)
+        self.record_status(response.status_code)
+        return response
+
+    async def run_steps_async(self, steps, session, pan_number=None):
+        """run_steps for the async API; returns (what the generator returns, requests sent)"""
+        outcome, failed = None, False
+        requests_sent = 0
+        while True:
+            try:
+                method, url, kwargs = steps.throw(outcome) if failed else steps.send(outcome)
+            except StopIteration as stop:
+                return stop.value, requests_sent
+            try:
+                outcome = await self.send_async(session, method, url, pan_number, **kwargs)
+                failed = False
+            except Exception as e:
+                outcome, failed = e, True
+            if not isinstance(outcome, CircuitOpenError):
+                requests_sent += 1
+
+    async def aclose(self):
+        """Close the async API's connections"""
+        if self.connector:
+            await self.connector.close()
+            self.connector = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    def prepare_lookup(self, session=None):
+        """Fetch a CSRF token and solve the captcha; returns (token, captcha_answer, failure reason)"""
+        return self.run_steps(self.prepare_steps(), session)
+
+    def prepare_steps(self):
+        # Step 1: Get initial page and CSRF token
+        token = yield from self.csrf_token_steps()
+        if not token:
+            return None, None, 'csrf_token'
+        
+        # Step 2: Get captcha and solve it
+        response = yield 'GET', self.search_url, {}
+        
+        # Find captcha
+        captcha_match = CAPTCHA_PATTERN.search(response.text)
+        if captcha_match:
+            captcha_text = captcha_match.group()
+        else:
+            captcha_text = self.find_captcha(make_soup(response.content))
+        if not captcha_text:
+            return token, None, 'captcha'
+        
+        captcha_answer = self.solve_captcha(captcha_text)
+        if not captcha_answer:
+            return token, None, 'captcha'
+        
+        return token, captcha_answer, None
+    
+    def finish_search(self, pan_number, result, issues=()):
+        """Give a failure its reason and record a definitive search outcome in the cache"""
+        self.classify_result(result, issues)
+        self.cache_outcome(pan_number, result)
+        return result
+
+    def classify_result(self, result, issues=()):
+        """Give a failed search its reason, from the problems the lookup met (see note_response and note_error)"""
+        if not result['success'] and (self.breaker.state != CircuitBreaker.CLOSED or self.breaker.consecutive_failures):
+            # The lookup ended on upstream failures, so the miss says nothing about the PAN
+            result['retry'] = True
+            result['reason'] = 'timeout' if 'timeout' in issues else 'portal_unavailable'
+            result['message'] = f"{FAILURE_REASONS[result['reason']]} ({self.breaker.describe()})"
+            return result
+        if result.get('not_found'):
+            result['reason'] = 'no_record'
+            result.setdefault('message', 'No record found for PAN')
+        elif not result['success']:
+            result.setdefault('reason', miss_reason(issues))
+            result.setdefault('message', FAILURE_REASONS[result['reason']])
+        return result
+
+    def cache_outcome(self, pan_number, result):
+        """Cache a definitive outcome (found, or no such PAN); misses that should be retried are not cached"""
+        if not self.cache or result.get('cached') or result.get('retry'):
+            return
+        if result['success']:
+            self.cache.put(pan_number, result)
+        elif result.get('not_found'):
+            self.cache.put_negative(pan_number)
+
+    def is_no_record_response(self, response):
+        """Check whether a response definitively says the PAN does not exist"""
+        try:
+            data = response.json()
+            # The lookup API always returns the panDetails key; empty means no such PAN
+            if isinstance(data, dict) and 'panDetails' in data:
+                return not data['panDetails'] and not data.get('panRegistrationDetail')
+        except ValueError:
+            pass
+        return bool(NO_RECORD_PATTERN.search(response.text))
+
+    def search_pans_bulk(self, pan_numbers):
+        """Look up several PANs with one statistics request; returns {pan: result} for the PANs it answered"""
+        if self.bulk_payload is False or len(pan_numbers) < 2:
+            return {}
+        
+        try:
+            self.current_pan = None
+            token, captcha_answer, error = self.prepare_lookup()
+            if error:
+                return {}
             
-            captcha_answer = self.solve_captcha(captcha_text)
-            if not captcha_answer:
-                return {'success': False, 'message': 'Could not solve captcha'}
+            url = self.base_url + self.ajax_endpoints['pan_stats']
+            headers = {
+                'Referer': self.search_url,
+                'Origin': self.base_url,
+                'X-CSRF-TOKEN': token
+            }
             
-            # Step 3: Try each AJAX endpoint
-            for endpoint_name, endpoint_path in self.ajax_endpoints.items():
-                self.logger.info(f"Trying AJAX endpoint: {endpoint_name} ({endpoint_path})")
+            variants = [self.bulk_payload] if self.bulk_payload is not None else range(len(BULK_PAYLOADS))
+            for index in variants:
+                field, join, encoding = BULK_PAYLOADS[index]
+                payload = {
+                    field: ','.join(pan_numbers) if join == 'comma' else list(pan_numbers),
+                    'captcha': captcha_answer,
+                    '_token': token
+                }
+                if encoding == 'json':
+                    response = self.send('POST', url, json=payload, headers=headers)
+                else:
+                    response = self.send('POST', url, data=payload, headers=headers)
                 
-                result = self.try_ajax_endpoint(endpoint_path, pan_number, captcha_answer, token)
-                if result['success']:
-                    self.logger.info(f"Success with endpoint: {endpoint_name}")
-                    return result
+                if response.status_code != 200:
+                    continue
+                try:
+                    data = response.json()
+                except ValueError:
+                    continue
+                
+                results = self.split_bulk_response(data, pan_numbers)
+                if results:
+                    self.bulk_payload = index
+                    self.logger.info("Bulk lookup answered %d of %d PANs", len(results), len(pan_numbers))
+                    return {pan: self.finish_search(pan, result) for pan, result in results.items()}
             
-            # Step 4: Try the discovered submission method
-            return self.try_discovered_method(pan_number, captcha_answer, token)
+            if self.bulk_payload is None:
+                self.logger.info("Statistics endpoint does not answer multi-PAN requests, using per-PAN lookups")
+                self.bulk_payload = False
+            return {}
             
+        except CircuitOpenError:
+            return {}
         except Exception as e:
-            self.logger.error(f"AJAX search failed: {e}")
-            return {'success': False, 'message': str(e)}
+            self.logger.error("Bulk lookup failed: %s", e)
+            return {}
+    
+    def split_bulk_response(self, data, pan_numbers):
+        """Split a multi-PAN JSON response into per-PAN results"""
+        if not isinstance(data, dict):
+            return {}
+        
+        wanted = set(pan_numbers)
+        grouped = {}
+        for section in BULK_SECTIONS:
+            for record in data.get(section) or []:
+                pan = ''
+                if isinstance(record, dict):
+                    pan = str(record.get('pan') or record.get('panNo') or record.get('pan_No') or '').strip()
+                if pan not in wanted:
+                    # A record we cannot attribute would be silently lost, so distrust the whole response
+                    return {}
+                grouped.setdefault(pan, {}).setdefault(section, []).append(record)
+        
+        results = {}
+        for pan, sections in grouped.items():
+            if 'panDetails' not in sections:
+                continue
+            result = self.parse_json_data(sections, pan)
+            if result['success']:
+                result['source'] = 'bulk-stats'
+                result['endpoint'] = 'bulk_stats'
+                results[pan] = result
+        return results
     
     def find_captcha(self, soup):
         """Find captcha on the page"""
@@ -145,11 +950,15 @@ class AjaxPANScraper:
             return None
             
         except Exception as e:
-            self.logger.error(f"Error finding captcha: {e}")
+            self.logger.error("Error finding captcha: %s", e)
             return None
     
-    def try_ajax_endpoint(self, endpoint_path, pan_number, captcha_answer, token):
+    def try_ajax_endpoint(self, endpoint_path, pan_number, captcha_answer, token, issues=None):
         """Try a specific AJAX endpoint"""
+        return self.run_steps(self.ajax_endpoint_steps(endpoint_path, pan_number, captcha_answer, token,
+                                                       set() if issues is None else issues))
+
+    def ajax_endpoint_steps(self, endpoint_path, pan_number, captcha_answer, token, issues):
         try:
             url = self.base_url + endpoint_path
             
@@ -168,62 +977,111 @@ class AjaxPANScraper:
                 'Origin': self.base_url,
                 'X-CSRF-TOKEN': token
             }
+            no_record_hint = False
             
             for i, payload in enumerate(payloads):
                 try:
                     # Try JSON request
-                    response = self.session.post(url, json=payload, headers=headers)
+                    response = yield 'POST', url, {'json': payload, 'headers': headers}
                     
-                    self.logger.info(f"  Payload {i+1}: Status {response.status_code}")
+                    self.logger.debug("  Payload %d: Status %s", i + 1, response.status_code)
+                    note_response(issues, response)
                     
                     if response.status_code == 200:
                         # Save response for debugging
-                        with open(f"ajax_{endpoint_path.replace('/', '_')}_payload_{i+1}.html", "w", encoding="utf-8") as f:
-                            f.write(response.text)
+                        if self.logger.isEnabledFor(logging.DEBUG):
+                            with open(f"ajax_{endpoint_path.replace('/', '_')}_payload_{i+1}.html", "w", encoding="utf-8") as f:
+                                f.write(response.text)
                         
-                        # Try to parse response
-                        result = self.parse_ajax_response(response, pan_number, f"ajax-{endpoint_path}")
-                        if result['success']:
+                        result = self.parse_lookup_response(response, pan_number, f"ajax-{endpoint_path}")
+                        if result.get('not_found') and not is_evaluated_payload(payload):
+                            no_record_hint = True
+                        elif result['success'] or result.get('not_found'):
                             return result
-                        
-                        # Try to parse as JSON
-                        try:
-                            json_data = response.json()
-                            result = self.parse_json_data(json_data, pan_number)
-                            if result['success']:
-                                return result
-                        except:
-                            pass
-                    
+
                     # Try form-data request
                     headers_form = headers.copy()
                     headers_form['Content-Type'] = 'application/x-www-form-urlencoded'
                     
-                    response = self.session.post(url, data=payload, headers=headers_form)
+                    response = yield 'POST', url, {'data': payload, 'headers': headers_form}
+                    note_response(issues, response)
                     
                     if response.status_code == 200:
                         # Save response for debugging
-                        with open(f"ajax_{endpoint_path.replace('/', '_')}_form_{i+1}.html", "w", encoding="utf-8") as f:
-                            f.write(response.text)
+                        if self.logger.isEnabledFor(logging.DEBUG):
+                            with open(f"ajax_{endpoint_path.replace('/', '_')}_form_{i+1}.html", "w", encoding="utf-8") as f:
+                                f.write(response.text)
                         
-                        result = self.parse_ajax_response(response, pan_number, f"ajax-form-{endpoint_path}")
-                        if result['success']:
+                        result = self.parse_lookup_response(response, pan_number, f"ajax-form-{endpoint_path}",
+                                                            json_fallback=False)
+                        if result.get('not_found') and not is_evaluated_payload(payload):
+                            no_record_hint = True
+                        elif result['success'] or result.get('not_found'):
                             return result
                             
+                except CircuitOpenError:
+                    raise
                 except Exception as e:
-                    self.logger.debug(f"  Payload {i+1} failed: {e}")
+                    self.logger.debug("  Payload %d failed: %s", i + 1, e)
+                    note_error(issues, e)
                     continue
             
-            return {'success': False}
+            # A guessed payload's no-record answer may mean the endpoint ignored it; keep it only as a hint
+            return {'success': False, 'no_record_hint': True} if no_record_hint else {'success': False}
             
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            self.logger.error(f"AJAX endpoint {endpoint_path} failed: {e}")
+            self.logger.error("AJAX endpoint %s failed: %s", endpoint_path, e)
             return {'success': False}
     
-    def try_discovered_method(self, pan_number, captcha_answer, token):
+    def parse_lookup_response(self, response, pan_number, source, json_fallback=True):
+        """Parse one 200 lookup response; shared by live lookups and archive replay"""
+        # Try to parse response
+        result = self.parse_ajax_response(response, pan_number, source)
+        if result['success']:
+            return result
+        
+        # Try to parse as JSON
+        if json_fallback:
+            try:
+                json_data = response.json()
+                result = self.parse_json_data(json_data, pan_number)
+                if result['success']:
+                    return result
+            except:
+                pass
+        
+        # Stop probing once the portal says the PAN does not exist
+        if self.is_no_record_response(response):
+            return {'success': False, 'not_found': True}
+        
+        return {'success': False}
+    
+    def parse_discovered_response(self, response, pan_number):
+        """Parse the response of the plain form submission"""
+        result = self.parse_ajax_response(response, pan_number, "discovered-method")
+        if result['success']:
+            return result
+        
+        # Check if the response contains JavaScript that makes AJAX calls
+        if 'panDetails' in response.text or 'panRegistrationDetail' in response.text:
+            self.logger.debug("Found AJAX calls in response, trying to extract data...")
+            return self.extract_ajax_data_from_response(response.text, pan_number)
+
+        if self.is_no_record_response(response):
+            return {'success': False, 'not_found': True}
+        
+        return {'success': False}
+    
+    def try_discovered_method(self, pan_number, captcha_answer, token, issues=None):
         """Try the exact form submission discovered during analysis"""
+        return self.run_steps(self.discovered_method_steps(pan_number, captcha_answer, token,
+                                                           set() if issues is None else issues))
+
+    def discovered_method_steps(self, pan_number, captcha_answer, token, issues):
         try:
-            self.logger.info("Trying discovered form submission method...")
+            self.logger.debug("Trying discovered form submission method...")
             
             # The form analysis showed this is the correct form
             url = self.search_url  # Form action was None, so submits to same page
@@ -241,29 +1099,27 @@ class AjaxPANScraper:
             }
             
             # Submit using POST (as discovered in form analysis)
-            response = self.session.post(url, data=form_data, headers=headers)
+            response = yield 'POST', url, {'data': form_data, 'headers': headers}
             
-            # Save response
-            with open("discovered_method_response.html", "w", encoding="utf-8") as f:
-                f.write(response.text)
+            # Save response for debugging
+            if self.logger.isEnabledFor(logging.DEBUG):
+                with open("discovered_method_response.html", "w", encoding="utf-8") as f:
+                    f.write(response.text)
             
-            self.logger.info(f"Discovered method response status: {response.status_code}")
+            self.logger.debug("Discovered method response status: %s", response.status_code)
+            note_response(issues, response)
             
             # Check if this triggers AJAX calls or redirects
             if response.status_code == 200:
-                result = self.parse_ajax_response(response, pan_number, "discovered-method")
-                if result['success']:
-                    return result
-                
-                # Check if the response contains JavaScript that makes AJAX calls
-                if 'panDetails' in response.text or 'panRegistrationDetail' in response.text:
-                    self.logger.info("Found AJAX calls in response, trying to extract data...")
-                    return self.extract_ajax_data_from_response(response.text, pan_number)
-            
+                return self.parse_discovered_response(response, pan_number)
+
             return {'success': False}
             
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            self.logger.error(f"Discovered method failed: {e}")
+            self.logger.error("Discovered method failed: %s", e)
+            note_error(issues, e)
             return {'success': False}
     
     def extract_ajax_data_from_response(self, response_text, pan_number):
@@ -279,7 +1135,7 @@ class AjaxPANScraper:
             for pattern in ajax_patterns:
                 matches = re.findall(pattern, response_text)
                 if matches:
-                    self.logger.info(f"Found AJAX call pattern: {pattern} with data: {matches}")
+                    self.logger.debug("Found AJAX call pattern: %s with data: %s", pattern, matches)
             
             # Try to find embedded JSON data
             json_patterns = [
@@ -302,7 +1158,7 @@ class AjaxPANScraper:
             return {'success': False}
             
         except Exception as e:
-            self.logger.error(f"Error extracting AJAX data: {e}")
+            self.logger.error("Error extracting AJAX data: %s", e)
             return {'success': False}
     
     def parse_ajax_response(self, response, pan_number, source):
@@ -314,7 +1170,7 @@ class AjaxPANScraper:
             if pan_number not in content:
                 return {'success': False}
             
-            self.logger.info(f"PAN {pan_number} found in {source} response!")
+            self.logger.debug("PAN %s found in %s response", pan_number, source)
             
             # Try JSON parsing first
             try:
@@ -323,20 +1179,11 @@ class AjaxPANScraper:
             except:
                 pass
             
-            # Try HTML parsing
-            soup = BeautifulSoup(content, 'html.parser')
-            
+            # Try HTML parsing: one walk over the page fills both records
             pan_details = self.get_empty_pan_details(pan_number)
             registration_details = []
-            
-            # Parse text patterns
-            page_text = soup.get_text()
-            self.parse_text_patterns(page_text, pan_details, registration_details, pan_number)
-            
-            # Parse tables
-            tables = soup.find_all('table')
-            for table in tables:
-                self.parse_table_data(table, pan_details, registration_details, pan_number)
+            extract_html_records(content, pan_details, registration_details, pan_number)
+            normalize_pan_details(pan_details, self.canonicalize)
             
             # Check success
             if (pan_details['Office'] or pan_details['Name'] or 
@@ -352,9 +1199,27 @@ class AjaxPANScraper:
             return {'success': False}
             
         except Exception as e:
-            self.logger.error(f"Error parsing {source} response: {e}")
+            self.logger.error("Error parsing %s response: %s", source, e)
             return {'success': False}
     
+    def parse_html_with_soup(self, content, pan_number):
+        """Reference HTML parse on a BeautifulSoup tree; the single-pass extractor must match it"""
+        soup = make_soup(content)
+        
+        pan_details = self.get_empty_pan_details(pan_number)
+        registration_details = []
+        
+        # Parse text patterns
+        page_text = soup.get_text()
+        self.parse_text_patterns(page_text, pan_details, registration_details, pan_number)
+        
+        # Parse tables
+        tables = soup.find_all('table')
+        for table in tables:
+            self.parse_table_data(table, pan_details, registration_details, pan_number)
+        
+        return pan_details, registration_details
+    
     def parse_json_data(self, data, pan_number):
         """Parse JSON data for PAN information from IRD API response"""
         try:
@@ -362,7 +1227,7 @@ class AjaxPANScraper:
             registration_details = []
             
             if isinstance(data, dict):
-                self.logger.info("Parsing IRD API JSON response...")
+                self.logger.debug("Parsing IRD API JSON response...")
                 
                 # Parse panDetails section
                 if 'panDetails' in data and data['panDetails']:
@@ -380,28 +1245,17 @@ class AjaxPANScraper:
                     pan_details['Street Name'] = pan_info.get('street_Name', '')
                     pan_details['City Name'] = pan_info.get('vdc_Town', '')
                     
-                    self.logger.info(f"Extracted PAN details: Name={pan_details['Name'][:50]}...")
+                    self.logger.debug("Extracted PAN details: Name=%.50s...", pan_details['Name'])
                 
                 # Parse registration details
                 if 'panRegistrationDetail' in data and data['panRegistrationDetail']:
-                    # Account type mapping
-                    account_types = {
-                        '0': 'VAT',
-                        '10': 'Income Tax', 
-                        '20': 'EXCISE',
-                        '30': 'Service Tax'
-                    }
-                    
                     for reg in data['panRegistrationDetail']:
-                        account_type = str(reg.get('acctType', ''))
-                        type_name = account_types.get(account_type, f"Type {account_type}")
+                        # Account type and status codes map through the tables in normalization.py
+                        type_name = account_type_name(reg.get('acctType', ''))
+                        status = account_status_name(reg.get('accountStatus', ''))
                         
                         # Convert Nepali date format if needed
-                        reg_date = reg.get('registrationDate', '')
-                        
-                        # Account status mapping
-                        status_map = {'A': 'Active', 'I': 'Inactive', 'C': 'Cancelled'}
-                        status = status_map.get(reg.get('accountStatus', ''), reg.get('accountStatus', ''))
+                        reg_date = intern_value(reg.get('registrationDate', ''))
                         
                         reg_detail = {
                             'PAN No': pan_number,
@@ -411,7 +1265,7 @@ class AjaxPANScraper:
                         }
                         registration_details.append(reg_detail)
                     
-                    self.logger.info(f"Extracted {len(registration_details)} registration records")
+                    self.logger.debug("Extracted %d registration records", len(registration_details))
                 
                 # Parse tax clearance for fiscal year
                 if 'panTaxClearance' in data and data['panTaxClearance']:
@@ -425,6 +1279,8 @@ class AjaxPANScraper:
                         pan_details['Fiscal Year/Return Verified Date'] = fiscal_year
                     elif verified_date:
                         pan_details['Fiscal Year/Return Verified Date'] = verified_date
+                
+                normalize_pan_details(pan_details, self.canonicalize)
             
             # Check if we got meaningful data
             if (pan_details['Office'] or pan_details['Name'] or 
@@ -440,7 +1296,7 @@ class AjaxPANScraper:
             return {'success': False}
             
         except Exception as e:
-            self.logger.error(f"Error parsing JSON data: {e}")
+            self.logger.error("Error parsing JSON data: %s", e)
             return {'success': False}
     
     def parse_text_patterns(self, page_text, pan_details, registration_details, pan_number):
@@ -503,7 +1359,7 @@ class AjaxPANScraper:
                         registration_details.append(reg_detail)
                         
         except Exception as e:
-            self.logger.debug(f"Error parsing text patterns: {e}")
+            self.logger.debug("Error parsing text patterns: %s", e)
     
     def parse_table_data(self, table, pan_details, registration_details, pan_number):
         """Parse table data for PAN information"""
@@ -551,7 +1407,7 @@ class AjaxPANScraper:
                         registration_details.append(reg_detail)
                         
         except Exception as e:
-            self.logger.debug(f"Error parsing table: {e}")
+            self.logger.debug("Error parsing table: %s", e)
     
     def get_empty_pan_details(self, pan_number):
         """Get empty PAN details structure"""
@@ -590,6 +1446,7 @@ def test_ajax_scraper():
         
         # Save to Excel
         try:
+            import pandas as pd
             pan_df = pd.DataFrame([result['pan_details']])
             reg_df = pd.DataFrame(result['registration_details'])
             
@@ -613,4 +1470,6 @@ def test_ajax_scraper():
                 print(f"  - {file}")
 
 if __name__ == "__main__":
+    # The test run keeps per-attempt logs and the debug response dumps
+    configure_logging(logging.DEBUG)
     test_ajax_scraper()
@@ -0,0 +1,129 @@
+"""
+Parallel batch engine
+Worker threads take PANs from a shared queue and look them up on a SessionPool;
+the number of workers and the retry limit can be changed while the batch runs
+"""
+
+import threading
+from collections import deque
+
+from circuit_breaker import CircuitBreaker, MAX_REQUEUES
+
+
+class BatchRunner:
+    def __init__(self, pool, pan_list, workers=1, max_requeues=MAX_REQUEUES,
+                 on_result=None, on_requeue=None, on_wait=None):
+        self.pool = pool
+        self.max_requeues = max_requeues
+        # Callbacks run on the worker threads: on_result(pan, result), on_requeue(pan, result),
+        # on_wait(breaker, delay) while the portal circuit is open
+        self.on_result = on_result
+        self.on_requeue = on_requeue
+        self.on_wait = on_wait
+
+        # PANs hit by a portal outage go back to the front of the queue
+        self.pending = deque(str(pan).strip() for pan in pan_list)
+        self.requeues = {}
+        self.in_flight = 0
+        self.workers = 0
+        self.target_workers = max(1, workers)
+        self.stopped = False
+        self.error = None
+        self.threads = []
+        self.condition = threading.Condition()
+
+    def set_workers(self, workers):
+        """Change the number of workers; surplus workers exit after their current PAN"""
+        with self.condition:
+            self.target_workers = max(1, workers)
+            if self.threads:
+                self.spawn_workers()
+            self.condition.notify_all()
+
+    def spawn_workers(self):
+        while self.workers < self.target_workers:
+            self.workers += 1
+            thread = threading.Thread(target=self.work, name=f'batch-worker-{len(self.threads) + 1}', daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def run(self):
+        """Process the whole queue; blocks until it is done or stop() is called"""
+        with self.condition:
+            self.spawn_workers()
+            while not self.stopped and (self.pending or self.in_flight):
+                self.condition.wait()
+            self.stopped = True
+            self.condition.notify_all()
+            threads = list(self.threads)
+        for thread in threads:
+            thread.join()
+        if self.error:
+            raise self.error
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def should_continue(self):
+        return not self.stopped
+
+    def take(self):
+        """Next PAN for a worker, or None when the worker should exit"""
+        with self.condition:
+            while True:
+                if self.stopped or self.workers > self.target_workers:
+                    self.workers -= 1
+                    self.condition.notify_all()
+                    return None
+                if self.pending:
+                    self.in_flight += 1
+                    return self.pending.popleft()
+                if not self.in_flight:
+                    # Queue drained and nothing can be re-queued any more
+                    self.workers -= 1
+                    self.condition.notify_all()
+                    return None
+                self.condition.wait()
+
+    def work(self):
+        try:
+            while True:
+                if self.pool.breaker.state != CircuitBreaker.CLOSED:
+                    self.pool.wait_for_portal(should_continue=self.should_continue, on_wait=self.on_wait)
+
+                pan_number = self.take()
+                if pan_number is None:
+                    return
+
+                result = {'success': False, 'message': 'Lookup did not finish'}
+                try:
+                    result = self.pool.search(pan_number)
+                finally:
+                    self.finish(pan_number, result)
+        except Exception as e:
+            # A failing callback (e.g. the Excel writer) ends the batch; run() re-raises the error
+            with self.condition:
+                self.error = self.error or e
+                self.stopped = True
+                self.workers -= 1
+                self.condition.notify_all()
+
+    def finish(self, pan_number, result):
+        with self.condition:
+            requeue = result.get('retry') and self.requeues.get(pan_number, 0) < self.max_requeues
+            if requeue:
+                self.requeues[pan_number] = self.requeues.get(pan_number, 0) + 1
+                self.pending.appendleft(pan_number)
+
+        try:
+            if requeue:
+                if self.on_requeue:
+                    self.on_requeue(pan_number, result)
+            elif self.on_result:
+                self.on_result(pan_number, result)
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
@@ -0,0 +1,70 @@
+"""
+Startup benchmark for the entry points
+Imports each module under `python -X importtime` and fails if startup regresses
+"""
+
+import argparse
+import subprocess
+import sys
+
+ENTRY_POINTS = ['pan_search', 'ajax_scraper', 'gui_scraper']
+
+# Heavy dependencies that must only load on the code paths that need them
+LAZY_MODULES = ['pandas', 'numpy', 'bs4', 'openpyxl']
+
+def measure_import(module):
+    """Import a module in a fresh interpreter and return {imported module: cumulative microseconds}"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr}")
+
+    timings = {}
+    for line in proc.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented name>"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+def run_benchmark(modules, runs, budget_ms):
+    """Benchmark each module, best of several runs; return True if all stay within budget"""
+    ok = True
+    print(f"{'Module':<16}{'Best (ms)':>12}{'Worst (ms)':>12}  Heavy imports")
+    print("-" * 60)
+
+    for module in modules:
+        samples = []
+        heavy = set()
+        for _ in range(runs):
+            timings = measure_import(module)
+            samples.append(timings[module] / 1000)
+            heavy.update(name for name in timings if name in LAZY_MODULES)
+
+        best = min(samples)
+        status = ', '.join(sorted(heavy)) or '-'
+        print(f"{module:<16}{best:>12.1f}{max(samples):>12.1f}  {status}")
+
+        if heavy:
+            print(f"  FAIL: {module} imports {status} at startup")
+            ok = False
+        if best > budget_ms:
+            print(f"  FAIL: {module} took {best:.1f} ms, budget is {budget_ms} ms")
+            ok = False
+
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time of the scraper entry points")
+    parser.add_argument('modules', nargs='*', default=ENTRY_POINTS, help="Modules to import")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per module (best is reported)")
+    parser.add_argument('--budget-ms', type=float, default=250, help="Maximum allowed import time per module")
+    args = parser.parse_args()
+
+    sys.exit(0 if run_benchmark(args.modules, args.runs, args.budget_ms) else 1)
+
+if __name__ == "__main__":
+    main()
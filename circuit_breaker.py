@@ -0,0 +1,76 @@
+"""
+Circuit breaker for traffic to the IRD portal
+Opens after consecutive upstream failures so batches pause instead of recording false negatives
+"""
+
+import threading
+import time
+
+# Times a batch re-queues one PAN because of portal outages before recording it as Failed
+MAX_REQUEUES = 5
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is refused because the portal circuit is open"""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, max_reset_timeout=600):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a request may go out now; an expired open circuit lets one probe through"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN:
+                # Probe failed: stay open and back off further before the next probe
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+                self.trip()
+            elif self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self.trip()
+
+    def trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+
+    def seconds_until_probe(self):
+        """Seconds left before the next half-open probe is allowed"""
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0, self.opened_at + self.reset_timeout - time.time())
+
+    def describe(self):
+        """Short human readable state for progress output"""
+        if self.state == self.OPEN:
+            return f"circuit open ({self.consecutive_failures} failures, next probe in {self.seconds_until_probe():.0f}s)"
+        return f"circuit {self.state}"
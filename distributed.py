@@ -0,0 +1,209 @@
+"""
+Distributed batch execution
+A coordinator puts the PAN list on a shared WorkQueue; workers on any number of
+nodes lease PANs from it, look them up on their own session pool and write the
+results back. Results are exported to Excel once the batch is done
+
+    python distributed.py enqueue --queue /shared/pans.db --file pans.csv
+    python distributed.py work --queue /shared/pans.db --sessions 3      (on each node)
+    python distributed.py status --queue /shared/pans.db
+    python distributed.py export --queue /shared/pans.db --output-dir output
+"""
+
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+
+from work_queue import WorkQueue
+from structured_log import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseKeeper(threading.Thread):
+    """Renews a worker's leases while it works through them"""
+
+    def __init__(self, queue, worker, batch):
+        super().__init__(name='lease-keeper', daemon=True)
+        self.queue = queue
+        self.worker = worker
+        self.batch = batch
+        self.pans = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def hold(self, pans):
+        with self.lock:
+            self.pans.update(pans)
+
+    def drop(self, pan):
+        with self.lock:
+            self.pans.discard(pan)
+
+    def run(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            with self.lock:
+                pans = list(self.pans)
+            if pans:
+                try:
+                    self.queue.renew(self.worker, pans, self.batch)
+                except Exception as e:
+                    # The lease may lapse and another worker repeat these PANs; that is allowed (at-least-once)
+                    logger.warning("Could not renew %d leases: %s", len(pans), e)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(queue, batch='default', sessions=1, delay=3, chunk=None, poll=5, egress_pool=None, hedging=None,
+               worker_id=None, base_url=None):
+    """Lease, look up and complete PANs until the batch is finished; returns the number of PANs completed"""
+    from ajax_scraper import DEFAULT_BASE_URL, is_transient_failure
+    from result_cache import ResultCache
+    from session_pool import SessionPool
+    from batch_runner import BatchRunner
+
+    worker = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    # Small chunks keep the work spread evenly and limit what a crashed worker holds up
+    chunk = chunk or sessions * 10
+    pool = SessionPool(size=sessions, min_interval=delay, cache=ResultCache(), egress_pool=egress_pool,
+                       pipeline=True, hedging=hedging, base_url=base_url or DEFAULT_BASE_URL)
+    keeper = LeaseKeeper(queue, worker, batch)
+    keeper.start()
+    completed = 0
+    completed_lock = threading.Lock()
+    deferred = {}
+
+    def on_result(pan, result):
+        nonlocal completed
+        if is_transient_failure(result) and pan not in deferred:
+            # Retried on fresh sessions once the chunk is done; the lease stays held meanwhile
+            with completed_lock:
+                deferred[pan] = result
+            return
+        keeper.drop(pan)
+        if result.get('retry') or is_transient_failure(result):
+            # Still failing (or the portal stayed unavailable); leave the PAN for a later attempt on any
+            # node, until it has used up the queue's max_attempts
+            queue.release(worker, pan, batch, result)
+            return
+        queue.complete(worker, pan, result, batch)
+        with completed_lock:
+            completed += 1
+
+    try:
+        pool.warm_up()
+        print(f"Worker {worker} serving batch '{batch}' with {sessions} session(s)")
+        while True:
+            pans = queue.lease(worker, chunk, batch)
+            if not pans:
+                if queue.is_finished(batch):
+                    break
+                # Everything left is leased by other workers; wait in case one of them dies
+                time.sleep(poll)
+                continue
+
+            keeper.hold(pans)
+            BatchRunner(pool, pans, workers=sessions, on_result=on_result).run()
+            if deferred:
+                for pan, result in pool.retry_transient(deferred).items():
+                    on_result(pan, result)
+                deferred.clear()
+            print(f"Worker {worker}: {completed} PANs completed - {queue.describe(batch)}")
+    finally:
+        keeper.stop()
+        pool.close()
+    return completed
+
+
+def export_results(queue, batch='default', output_dir='.', store=None):
+    """Write a finished (or partly finished) batch to Excel, and found records to the store if given;
+    returns (pan_file, reg_file)"""
+    from ajax_scraper import failure_reason
+    from excel_writer import ExcelResultWriter, failed_row
+
+    writer = ExcelResultWriter(output_dir)
+    for pan, result in queue.results(batch):
+        if result.get('success'):
+            writer.add_result(result['pan_details'], result['registration_details'])
+            if store:
+                store.add(result['pan_details'], result['registration_details'])
+        else:
+            writer.add_result(failed_row(pan, failure_reason(result)))
+    return writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed PAN batches over a shared SQLite work queue")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def command(name, help_text):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument('--queue', required=True, help="Queue database, on a filesystem all nodes can reach")
+        sub.add_argument('--batch', default='default', help="Batch name within the queue")
+        return sub
+
+    enqueue = command('enqueue', "Put PANs on the queue (coordinator)")
+    enqueue.add_argument('pans', nargs='*', help="PAN numbers")
+    enqueue.add_argument('-f', '--file', help="CSV/TXT file with PAN numbers")
+
+    work = command('work', "Lease and look up PANs until the batch is done (worker)")
+    work.add_argument('--sessions', type=int, default=1, help="Independent sessions on this node")
+    work.add_argument('--delay', type=float, default=3, help="Seconds between lookups on one session")
+    work.add_argument('--chunk', type=int, help="PANs leased at a time (default 10 per session)")
+    work.add_argument('--lease', type=float, default=120, help="Seconds a lease lasts without renewal")
+    work.add_argument('--base-url', help="Portal address, e.g. a local mock_portal.py")
+    work.add_argument('--proxies', metavar='FILE', help="Route sessions through the HTTP proxies listed in FILE")
+    work.add_argument('--hedge', type=float, default=0, metavar='PERCENT',
+                      help="Duplicate lookup requests slower than the recent p95, up to PERCENT extra requests")
+
+    command('status', "Show batch progress")
+
+    export = command('export', "Write the batch results to Excel")
+    export.add_argument('--output-dir', default='.')
+    export.add_argument('--store', default='pan_records.db', metavar='DB',
+                        help="Also keep found records in this searchable store (see pan_query.py)")
+    export.add_argument('--no-store', action='store_true')
+
+    args = parser.parse_args()
+    configure_logging(getattr(logging, args.log_level))
+    queue = WorkQueue(args.queue, lease_seconds=getattr(args, 'lease', 120))
+
+    try:
+        if args.command == 'enqueue':
+            from pan_search import load_pans_from_file
+            pans = list(args.pans)
+            if args.file:
+                pans.extend(load_pans_from_file(args.file))
+            added = queue.enqueue(pans, args.batch)
+            print(f"Added {added} of {len(pans)} PANs to batch '{args.batch}' - {queue.describe(args.batch)}")
+        elif args.command == 'work':
+            from egress import EgressPool
+            from hedging import HedgePolicy
+            egress_pool = EgressPool.from_file(args.proxies) if args.proxies else None
+            hedging = HedgePolicy(budget=args.hedge / 100) if args.hedge > 0 else None
+            completed = run_worker(queue, args.batch, sessions=args.sessions, delay=args.delay, chunk=args.chunk,
+                                   egress_pool=egress_pool, hedging=hedging, base_url=args.base_url)
+            print(f"Batch '{args.batch}' finished; this worker completed {completed} PANs")
+        elif args.command == 'status':
+            print(f"Batch '{args.batch}': {queue.describe(args.batch)}")
+        elif args.command == 'export':
+            os.makedirs(args.output_dir, exist_ok=True)
+            from record_store import RecordStore
+            store = None if args.no_store else RecordStore(args.store)
+            pan_file, reg_file = export_results(queue, args.batch, args.output_dir, store)
+            if store:
+                store.close()
+            print(f"📁 PAN details saved to: {pan_file}")
+            if reg_file:
+                print(f"📁 Registration details saved to: {reg_file}")
+    finally:
+        queue.close()
+
+if __name__ == "__main__":
+    main()
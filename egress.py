@@ -0,0 +1,127 @@
+"""
+Egress routing for portal traffic
+Spreads sessions (or single requests) across a list of HTTP proxies, tracks
+latency and error rate per proxy and takes unhealthy ones out of rotation
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class Egress:
+    """One way out: a proxy URL, or None for a direct connection"""
+
+    def __init__(self, url):
+        self.url = url
+        self.requests = 0
+        self.errors = 0
+        self.latency = None
+        self.outcomes = deque(maxlen=20)
+        self.consecutive_errors = 0
+        self.disabled_until = 0
+        self.times_dropped = 0
+        self.sessions = 0
+
+    @property
+    def proxies(self):
+        """Proxy mapping for requests"""
+        return {'http': self.url, 'https': self.url} if self.url else {}
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def is_available(self, now=None):
+        return (now or time.time()) >= self.disabled_until
+
+    def describe(self):
+        latency = f"{self.latency * 1000:.0f} ms" if self.latency is not None else "-"
+        state = "" if self.is_available() else f", dropped for {self.disabled_until - time.time():.0f}s"
+        return (f"{self.url or 'direct'}: {self.requests} requests, {self.errors} errors "
+                f"({self.error_rate * 100:.0f}% recent), {self.times_dropped} drops, "
+                f"{latency}{state}")
+
+
+class EgressPool:
+    # Latency is an exponentially weighted average; this is the weight of the newest sample
+    LATENCY_WEIGHT = 0.2
+
+    def __init__(self, proxies, per_request=False, max_error_rate=0.5, min_samples=5, max_consecutive_errors=3,
+                 cooldown=300):
+        self.egresses = [Egress(url) for url in proxies] or [Egress(None)]
+        # Sticky proxy per session by default; per_request rotates on every request
+        self.per_request = per_request
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.max_consecutive_errors = max_consecutive_errors
+        self.cooldown = cooldown
+        self.rotation = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **options):
+        """One proxy URL per line; blank lines and # comments are ignored"""
+        with open(path, 'r', encoding='utf-8') as f:
+            proxies = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+        return cls(proxies, **options)
+
+    def candidates(self):
+        now = time.time()
+        available = [e for e in self.egresses if e.is_available(now)]
+        # With everything dropped, keep going through the one that comes back first
+        return available or [min(self.egresses, key=lambda e: e.disabled_until)]
+
+    def assign(self, previous=None):
+        """Egress for a new session: the least loaded healthy one, then the fastest"""
+        with self.lock:
+            if previous:
+                previous.sessions -= 1
+            egress = min(self.candidates(), key=lambda e: (e.sessions, e.latency or 0))
+            egress.sessions += 1
+            return egress
+
+    def next_egress(self):
+        """Egress for a single request in per-request mode (round robin over healthy ones)"""
+        with self.lock:
+            candidates = self.candidates()
+            self.rotation += 1
+            return candidates[self.rotation % len(candidates)]
+
+    def release(self, egress):
+        with self.lock:
+            egress.sessions -= 1
+
+    def record(self, egress, latency, ok):
+        """Report one request; an egress that errors too often is dropped for the cooldown"""
+        with self.lock:
+            egress.requests += 1
+            egress.outcomes.append(ok)
+            if ok:
+                egress.consecutive_errors = 0
+                egress.latency = latency if egress.latency is None else (
+                    self.LATENCY_WEIGHT * latency + (1 - self.LATENCY_WEIGHT) * egress.latency)
+                return
+
+            egress.errors += 1
+            egress.consecutive_errors += 1
+            unhealthy = (egress.consecutive_errors >= self.max_consecutive_errors or
+                         (len(egress.outcomes) >= self.min_samples and egress.error_rate > self.max_error_rate))
+            if unhealthy and egress.is_available() and len(self.egresses) > 1:
+                egress.disabled_until = time.time() + self.cooldown
+                egress.times_dropped += 1
+                # Comes back with a clean record, like a half-open circuit
+                egress.outcomes.clear()
+                egress.consecutive_errors = 0
+
+    def healthy_count(self):
+        with self.lock:
+            now = time.time()
+            return sum(1 for e in self.egresses if e.is_available(now))
+
+    def describe(self):
+        return f"{self.healthy_count()}/{len(self.egresses)} egress healthy"
+
+    def report(self):
+        with self.lock:
+            return [e.describe() for e in self.egresses]
@@ -0,0 +1,138 @@
+"""
+Background Excel output
+Results are queued from the scraping thread and streamed into write-only
+openpyxl workbooks by a dedicated writer thread, so scraping never waits on Excel
+"""
+
+import os
+import queue
+import threading
+from datetime import datetime
+
+PAN_COLUMNS = ['PAN No', 'Status', 'Office', 'PAN', 'Name', 'Telephone', 'Ward', 'Street Name', 'City Name',
+               'Fiscal Year/Return Verified Date', 'Reason']
+REGISTRATION_COLUMNS = ['PAN No', 'Type', 'Reg. Date', 'Status']
+
+
+def failed_row(pan, reason=''):
+    """PAN sheet row for a PAN that could not be looked up, with the final reason"""
+    return {
+        'PAN No': pan,
+        'Status': 'Failed',
+        'Office': '',
+        'PAN': '',
+        'Name': '',
+        'Telephone': '',
+        'Ward': '',
+        'Street Name': '',
+        'City Name': '',
+        'Fiscal Year/Return Verified Date': '',
+        'Reason': reason,
+    }
+
+
+class StreamingSheet:
+    """A write-only workbook with one sheet; rows go to disk as they are appended"""
+
+    def __init__(self, path, columns):
+        from openpyxl import Workbook
+
+        self.path = path
+        self.columns = columns
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Sheet1')
+        self.sheet.append(columns)
+        self.rows = 0
+
+    def append(self, row):
+        self.sheet.append([row.get(column, '') for column in self.columns])
+        self.rows += 1
+
+    def save(self):
+        self.workbook.save(self.path)
+
+
+class ExcelResultWriter:
+    def __init__(self, output_dir='.', timestamp=None, chunk_size=500,
+                 pan_columns=PAN_COLUMNS, registration_columns=REGISTRATION_COLUMNS, profiler=None):
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.pan_file = os.path.join(output_dir, f'pan_details_{timestamp}.xlsx')
+        self.reg_file = os.path.join(output_dir, f'registration_details_{timestamp}.xlsx')
+        self.pan_columns = pan_columns
+        self.registration_columns = registration_columns
+        self.chunk_size = chunk_size
+        # Optional RunProfiler; the writer thread's work is profiled as the 'excel' stage
+        self.profiler = profiler
+
+        # Bounded so a stalled writer applies backpressure instead of buffering the whole run
+        self.queue = queue.Queue(maxsize=chunk_size * 20)
+        self.error = None
+        self.pan_sheet = None
+        self.reg_sheet = None
+        self.thread = threading.Thread(target=self.run, name='excel-writer', daemon=True)
+        self.thread.start()
+
+    def add_result(self, pan_details, registration_details=()):
+        """Queue one PAN row and its registrations for writing"""
+        if self.error:
+            raise self.error
+        self.queue.put(('pan', pan_details))
+        for registration in registration_details:
+            self.queue.put(('reg', registration))
+
+    def run(self):
+        if self.profiler:
+            self.profiler.run('excel', self.write_all)
+        else:
+            self.write_all()
+
+    def write_all(self):
+        try:
+            done = False
+            while not done:
+                # Block for the first item, then drain up to a chunk without waiting
+                items = [self.queue.get()]
+                while len(items) < self.chunk_size:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                for item in items:
+                    if item is None:
+                        done = True
+                        break
+                    kind, row = item
+                    if kind == 'pan':
+                        if self.pan_sheet is None:
+                            self.pan_sheet = StreamingSheet(self.pan_file, self.pan_columns)
+                        self.pan_sheet.append(row)
+                    else:
+                        if self.reg_sheet is None:
+                            self.reg_sheet = StreamingSheet(self.reg_file, self.registration_columns)
+                        self.reg_sheet.append(row)
+
+            if self.pan_sheet:
+                self.pan_sheet.save()
+            if self.reg_sheet:
+                self.reg_sheet.save()
+        except Exception as e:
+            self.error = e
+            # Keep draining so producers blocked on a full queue are released
+            while True:
+                try:
+                    if self.queue.get(timeout=1) is None:
+                        break
+                except queue.Empty:
+                    break
+
+    def close(self):
+        """Finish writing; returns (pan_file, reg_file), with None for a workbook that got no rows"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+        return (self.pan_file if self.pan_sheet else None,
+                self.reg_file if self.reg_sheet else None)
@@ -7,10 +7,36 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
 import os
-from ajax_scraper import AjaxPANScraper
-import pandas as pd
+from result_cache import ResultCache
+from circuit_breaker import MAX_REQUEUES
+from session_pool import SessionPool
+from ajax_scraper import DEFAULT_BASE_URL, failure_reason, is_transient_failure
+from rate_limiter import RateLimiter
+from hedging import HedgePolicy
+from batch_runner import BatchRunner
+from excel_writer import ExcelResultWriter, failed_row
+from run_stats import RunStats
+from record_store import RecordStore
+from profiling import RunProfiler
+from structured_log import configure_logging
 import logging
-from datetime import datetime
+
+# How often the statistics panel refreshes while a batch runs
+STATS_REFRESH_MS = 250
+
+# Log lines are written to the widget in batches, and only the newest lines are kept
+LOG_FLUSH_MS = 100
+MAX_LOG_LINES = 5000
+
+STATS_FIELDS = [
+    ('pans_per_sec', "PANs/sec"),
+    ('requests_per_pan', "Requests per PAN"),
+    ('success_rate', "Success rate"),
+    ('cache_hit_rate', "Cache hit rate"),
+    ('sessions', "Sessions"),
+    ('hedging', "Hedged requests"),
+    ('endpoints', "Data source"),
+]
 
 class PANScraperGUI:
     def __init__(self, root):
@@ -18,9 +44,18 @@ class PANScraperGUI:
         self.root.title("PAN Scraper - IRD Nepal Automation")
         self.root.geometry("800x600")
         
-        self.scraper = AjaxPANScraper()
+        self.cache = ResultCache()
+        # Portal address; soak_test.py points it at a local mock portal
+        self.base_url = DEFAULT_BASE_URL
+        self.pool = None
+        self.runner = None
+        self.stats = None
         self.processing = False
         
+        self.log_buffer = []
+        self.log_lock = threading.Lock()
+        self.log_flush_pending = False
+        
         self.setup_ui()
     
     def setup_ui(self):
@@ -75,10 +110,34 @@ class PANScraperGUI:
         self.delay_var = tk.StringVar(value="3")
         ttk.Entry(settings_frame, textvariable=self.delay_var, width=10).grid(row=0, column=1, sticky=tk.W, padx=(5, 0))
         
-        ttk.Label(settings_frame, text="Output directory:").grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        ttk.Label(settings_frame, text="Concurrency (parallel sessions):").grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        self.sessions_var = tk.StringVar(value="1")
+        ttk.Entry(settings_frame, textvariable=self.sessions_var, width=10).grid(row=1, column=1, sticky=tk.W, padx=(5, 0), pady=(5, 0))
+        
+        ttk.Label(settings_frame, text="Max requests/sec (0 = unlimited):").grid(row=2, column=0, sticky=tk.W, pady=(5, 0))
+        self.rate_var = tk.StringVar(value="0")
+        ttk.Entry(settings_frame, textvariable=self.rate_var, width=10).grid(row=2, column=1, sticky=tk.W, padx=(5, 0), pady=(5, 0))
+        
+        ttk.Label(settings_frame, text="Retries per PAN:").grid(row=3, column=0, sticky=tk.W, pady=(5, 0))
+        self.retries_var = tk.StringVar(value=str(MAX_REQUEUES))
+        ttk.Entry(settings_frame, textvariable=self.retries_var, width=10).grid(row=3, column=1, sticky=tk.W, padx=(5, 0), pady=(5, 0))
+        
+        ttk.Label(settings_frame, text="Hedge budget (% extra requests, 0 = off):").grid(row=4, column=0, sticky=tk.W, pady=(5, 0))
+        self.hedge_var = tk.StringVar(value="0")
+        ttk.Entry(settings_frame, textvariable=self.hedge_var, width=10).grid(row=4, column=1, sticky=tk.W, padx=(5, 0), pady=(5, 0))
+        
+        self.apply_button = ttk.Button(settings_frame, text="Apply to Running Batch", command=self.apply_settings,
+                                       state="disabled")
+        self.apply_button.grid(row=0, column=2, rowspan=2, padx=(5, 0))
+        
+        ttk.Label(settings_frame, text="Output directory:").grid(row=5, column=0, sticky=tk.W, pady=(5, 0))
         self.output_dir = tk.StringVar(value="output")
-        ttk.Entry(settings_frame, textvariable=self.output_dir, width=30).grid(row=1, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
-        ttk.Button(settings_frame, text="Browse", command=self.browse_output_dir).grid(row=1, column=2, padx=(5, 0))
+        ttk.Entry(settings_frame, textvariable=self.output_dir, width=30).grid(row=5, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        ttk.Button(settings_frame, text="Browse", command=self.browse_output_dir).grid(row=5, column=2, padx=(5, 0))
+        
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Profile run (profile saved next to the Excel files)",
+                        variable=self.profile_var).grid(row=6, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
         
         # Control buttons
         button_frame = ttk.Frame(main_frame)
@@ -100,9 +159,23 @@ class PANScraperGUI:
         self.status_label = ttk.Label(main_frame, text="Ready to process PAN numbers")
         self.status_label.grid(row=5, column=0, columnspan=3, sticky=tk.W)
         
+        # Live statistics
+        stats_frame = ttk.LabelFrame(main_frame, text="Live Statistics", padding="10")
+        stats_frame.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(10, 0))
+        
+        self.stats_vars = {}
+        for index, (key, label) in enumerate(STATS_FIELDS):
+            row, column = divmod(index, 2)
+            if key == 'endpoints':
+                row, column = len(STATS_FIELDS) // 2, 0
+            ttk.Label(stats_frame, text=f"{label}:").grid(row=row, column=column * 2, sticky=tk.W, padx=(0, 5))
+            self.stats_vars[key] = tk.StringVar(value="-")
+            ttk.Label(stats_frame, textvariable=self.stats_vars[key]).grid(
+                row=row, column=column * 2 + 1, columnspan=3 if key == 'endpoints' else 1, sticky=tk.W, padx=(0, 20))
+        
         # Log area
         log_frame = ttk.LabelFrame(main_frame, text="Processing Log", padding="10")
-        log_frame.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
+        log_frame.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(10, 0))
         
         self.log_text = scrolledtext.ScrolledText(log_frame, width=80, height=15)
         self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -111,7 +184,7 @@ class PANScraperGUI:
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
         main_frame.columnconfigure(0, weight=1)
-        main_frame.rowconfigure(6, weight=1)
+        main_frame.rowconfigure(7, weight=1)
         log_frame.columnconfigure(0, weight=1)
         log_frame.rowconfigure(0, weight=1)
         
@@ -177,20 +250,25 @@ class PANScraperGUI:
                 messagebox.showerror("Error", "No PAN numbers found. Please enter PAN numbers or select a file.")
                 return
             
-            delay = int(self.delay_var.get())
+            settings = self.read_settings()
             output_dir = self.output_dir.get()
             
             # Update UI
             self.processing = True
             self.start_button.config(state="disabled")
             self.stop_button.config(state="normal")
+            self.apply_button.config(state="normal")
             self.progress.start()
             self.status_label.config(text=f"Processing {len(pan_list)} PAN numbers...")
+            self.pool = None
+            self.runner = None
+            self.stats = RunStats(len(pan_list))
+            self.root.after(STATS_REFRESH_MS, self.refresh_stats)
             
             # Start processing in a separate thread
             self.processing_thread = threading.Thread(
                 target=self.process_pans, 
-                args=(pan_list, output_dir, delay)
+                args=(pan_list, output_dir, settings)
             )
             self.processing_thread.daemon = True
             self.processing_thread.start()
@@ -199,128 +277,162 @@ class PANScraperGUI:
             messagebox.showerror("Error", f"Failed to start processing: {e}")
             self.stop_processing()
     
-    def process_pans(self, pan_list, output_dir, delay):
-        """Process PANs in background thread"""
+    def log(self, text):
+        """Append to the log from any thread; lines are batched and the widget is only touched on the Tk thread"""
+        with self.log_lock:
+            self.log_buffer.append(text)
+            if self.log_flush_pending:
+                return
+            self.log_flush_pending = True
+        self.root.after(LOG_FLUSH_MS, self.flush_log)
+    
+    def flush_log(self):
+        """Write buffered log lines in one insert and keep the widget to MAX_LOG_LINES"""
+        with self.log_lock:
+            text = ''.join(self.log_buffer)
+            self.log_buffer = []
+            self.log_flush_pending = False
+        self.log_text.insert(tk.END, text)
+        lines = int(self.log_text.index('end-1c').split('.')[0])
+        if lines > MAX_LOG_LINES:
+            self.log_text.delete("1.0", f"{lines - MAX_LOG_LINES + 1}.0")
+        self.log_text.see(tk.END)
+    
+    def read_settings(self):
+        """Performance settings from the form; raises ValueError for invalid input"""
+        settings = {
+            'delay': float(self.delay_var.get()),
+            'sessions': int(self.sessions_var.get()),
+            'rate': float(self.rate_var.get() or 0),
+            'retries': int(self.retries_var.get()),
+            'hedge': float(self.hedge_var.get() or 0),
+            'profile': self.profile_var.get(),
+        }
+        if (settings['delay'] < 0 or settings['sessions'] < 1 or settings['rate'] < 0 or settings['retries'] < 0
+                or settings['hedge'] < 0):
+            raise ValueError("Settings must not be negative and concurrency must be at least 1")
+        return settings
+    
+    def apply_settings(self):
+        """Apply the performance settings to the running batch"""
+        try:
+            settings = self.read_settings()
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid settings: {e}")
+            return
+        if not (self.processing and self.pool and self.runner):
+            return
+        
+        self.pool.set_min_interval(settings['delay'])
+        self.pool.rate_limiter.set_rate(settings['rate'])
+        self.pool.resize(settings['sessions'])
+        self.runner.set_workers(settings['sessions'])
+        self.runner.max_requeues = settings['retries']
+        self.pool.hedging.set_budget(settings['hedge'] / 100)
+        self.log(f"Settings applied: {settings['sessions']} sessions, {settings['delay']:g}s delay per session, "
+                 f"{self.pool.rate_limiter.describe()}, {settings['retries']} retries per PAN, "
+                 f"hedge budget {settings['hedge']:g}%\n")
+    
+    def process_pans(self, pan_list, output_dir, settings):
+        """Process PANs on a pool of worker threads"""
         try:
             # Setup logging
             class GUILogHandler(logging.Handler):
-                def __init__(self, text_widget):
+                def __init__(self, gui):
                     super().__init__()
-                    self.text_widget = text_widget
+                    self.gui = gui
                 
                 def emit(self, record):
                     try:
-                        msg = self.format(record) + '\n'
-                        self.text_widget.insert(tk.END, msg)
-                        self.text_widget.see(tk.END)
-                        self.text_widget.update()
+                        self.gui.log(self.format(record) + '\n')
                     except:
                         pass
             
-            # Add GUI handler to scraper logger
-            gui_handler = GUILogHandler(self.log_text)
+            gui_handler = GUILogHandler(self)
             gui_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-            self.scraper.logger.addHandler(gui_handler)
-            
-            # Process PANs using AJAX scraper
-            self.log_text.insert(tk.END, f"Starting batch processing of {len(pan_list)} PAN numbers...\n")
-            self.log_text.insert(tk.END, f"Output directory: {output_dir}\n")
-            self.log_text.insert(tk.END, f"Delay between requests: {delay} seconds\n\n")
-            
-            # Create output directory
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # Process each PAN
-            all_pan_details = []
-            all_registration_details = []
-            successful = 0
-            failed = 0
-            errors = []
-            
-            for i, pan_number in enumerate(pan_list, 1):
-                if not self.processing:  # Check if stopped
-                    break
+            profiler = RunProfiler(output_dir) if settings['profile'] else None
+            try:
+                # Each session waits `delay` seconds between its own lookups; the rate limit covers all of them
+                self.pool = SessionPool(size=settings['sessions'], min_interval=settings['delay'], cache=self.cache,
+                                        rate_limiter=RateLimiter(settings['rate']), base_url=self.base_url,
+                                        pipeline=True, hedging=HedgePolicy(budget=settings['hedge'] / 100),
+                                        profiler=profiler)
+                # Add GUI handler to scraper logger (shared by every batch, so it must come off again)
+                scraper_logger = self.pool.scraper.logger
+                scraper_logger.addHandler(gui_handler)
+                try:
+                    # Process PANs using AJAX scraper
+                    self.log(f"Starting batch processing of {len(pan_list)} PAN numbers...\n")
+                    self.log(f"Output directory: {output_dir}\n")
+                    self.log(f"Delay between requests: {settings['delay']:g} seconds per session\n")
+                    self.log(f"Concurrency: {settings['sessions']} sessions, {self.pool.rate_limiter.describe()}, "
+                             f"{settings['retries']} retries per PAN\n\n")
                     
-                progress = (i / len(pan_list)) * 100
-                self.log_text.insert(tk.END, f"Progress: {i}/{len(pan_list)} ({progress:.1f}%)\n")
-                self.log_text.insert(tk.END, f"Processing PAN: {pan_number}\n")
-                self.log_text.see(tk.END)
-                self.log_text.update()
-                
-                # Search PAN
-                result = self.scraper.search_pan_ajax(str(pan_number).strip())
-                
-                if result.get('success'):
-                    successful += 1
-                    all_pan_details.append(result['pan_details'])
-                    all_registration_details.extend(result['registration_details'])
-                else:
-                    failed += 1
-                    errors.append(f"PAN {pan_number}: No data found")
-                    # Add empty record for failed PAN
-                    empty_details = {
-                        'PAN No': pan_number,
-                        'Status': 'Failed',
-                        'Office': '',
-                        'PAN': '',
-                        'Name': '',
-                        'Telephone': '',
-                        'Ward': '',
-                        'Street Name': '',
-                        'City Name': '',
-                        'Fiscal Year/Return Verified Date': ''
-                    }
-                    all_pan_details.append(empty_details)
-                
-                # Delay between requests
-                if i < len(pan_list):  # Don't delay after last request
-                    import time
-                    time.sleep(delay)
-            
-            # Save results to Excel
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Save PAN details
-            pan_df = pd.DataFrame(all_pan_details)
-            pan_file = os.path.join(output_dir, f"pan_details_{timestamp}.xlsx")
-            pan_df.to_excel(pan_file, index=False)
-            
-            # Save registration details
-            if all_registration_details:
-                reg_df = pd.DataFrame(all_registration_details)
-                reg_file = os.path.join(output_dir, f"registration_details_{timestamp}.xlsx")
-                reg_df.to_excel(reg_file, index=False)
-            else:
-                reg_file = None
+                    # Create output directory
+                    os.makedirs(output_dir, exist_ok=True)
+                    
+                    # Open connections and prefetch the first tokens before the first PAN
+                    self.pool.warm_up()
+                    
+                    # Results from every worker stream to the same Excel files through one writer thread
+                    writer = ExcelResultWriter(output_dir, timestamp=profiler and profiler.timestamp,
+                                               profiler=profiler)
+                    try:
+                        # Found records also go to the searchable store (pan_query.py)
+                        store = RecordStore()
+                        try:
+                            errors = self.run_batch(pan_list, settings, writer, store, profiler)
+                        finally:
+                            store.close()
+                    finally:
+                        # Finish the Excel files
+                        pan_file, reg_file = writer.close()
+                finally:
+                    self.pool.close()
+                    scraper_logger.removeHandler(gui_handler)
+            finally:
+                # Stops the sampler thread; the files are only written for a finished batch
+                if profiler:
+                    profiler.stop()
+            profile_files = profiler.save() if profiler else ()
             
             # Create result summary
+            stats = self.stats.snapshot()
             result = {
-                'total_processed': len(pan_list),
-                'successful': successful,
-                'failed': failed,
-                'success_rate': (successful / len(pan_list)) * 100,
+                'total_processed': stats['done'],
+                'successful': stats['successful'],
+                'failed': stats['not_found'] + stats['failed'],
+                'success_rate': stats['success_rate'],
                 'errors': errors,
                 'pan_file': pan_file,
                 'reg_file': reg_file
             }
             
-            self.log_text.insert(tk.END, f"\n📁 Results saved to:\n")
-            self.log_text.insert(tk.END, f"  - {pan_file}\n")
+            summary = f"\n📁 Results saved to:\n  - {pan_file}\n"
             if reg_file:
-                self.log_text.insert(tk.END, f"  - {reg_file}\n")
+                summary += f"  - {reg_file}\n"
+            for profile_file in profile_files:
+                if profile_file:
+                    summary += f"  - {profile_file}\n"
             
-            self.log_text.insert(tk.END, f"\n{'='*50}\n")
-            self.log_text.insert(tk.END, f"PROCESSING STATISTICS\n")
-            self.log_text.insert(tk.END, f"{'='*50}\n")
-            self.log_text.insert(tk.END, f"Total Processed: {result['total_processed']}\n")
-            self.log_text.insert(tk.END, f"Successful: {result['successful']}\n")
-            self.log_text.insert(tk.END, f"Failed: {result['failed']}\n")
-            self.log_text.insert(tk.END, f"Success Rate: {result['success_rate']:.1f}%\n")
+            summary += f"\n{'='*50}\n"
+            summary += f"PROCESSING STATISTICS\n"
+            summary += f"{'='*50}\n"
+            summary += f"Total Processed: {result['total_processed']}\n"
+            summary += f"Successful: {result['successful']}\n"
+            summary += f"Failed: {result['failed']}\n"
+            summary += f"Success Rate: {result['success_rate']:.1f}%\n"
+            
+            if profiler:
+                summary += f"\nMost time spent in (own time):\n"
+                for function, own, calls in profiler.top():
+                    summary += f"  {own:7.3f}s {calls:7d}x  {function}\n"
             
             if errors:
-                self.log_text.insert(tk.END, f"\nErrors ({len(errors)}):\n")
+                summary += f"\nErrors ({len(errors)}):\n"
                 for error in errors:
-                    self.log_text.insert(tk.END, f"  - {error}\n")
+                    summary += f"  - {error}\n"
+            self.log(summary)
             
             # Update UI on completion
             self.root.after(0, self.processing_complete, result)
@@ -328,9 +440,90 @@ class PANScraperGUI:
         except Exception as e:
             self.root.after(0, self.processing_error, str(e))
     
+    def run_batch(self, pan_list, settings, writer, store, profiler):
+        """Look up every PAN (a second pass retries transient failures) into the writer and store;
+        returns the error lines for the summary"""
+        errors = []
+        # Transient failures are looked up again in a second pass once the first one is done
+        deferred = {}
+        
+        def on_result(pan_number, result):
+            if is_transient_failure(result) and pan_number not in deferred:
+                deferred[pan_number] = result
+                self.log(f"PAN {pan_number}: {failure_reason(result)}, retried in the second pass\n")
+                return
+            self.stats.record(result)
+            stats = self.stats.snapshot()
+            self.log(f"Progress: {stats['done']}/{len(pan_list)} - PAN {pan_number}: "
+                     f"{'Success' if result.get('success') else 'Failed'}\n")
+            status = f"Processing {stats['done']}/{len(pan_list)} PAN numbers - {self.pool.describe()}"
+            self.root.after(0, lambda text=status: self.status_label.config(text=text))
+            
+            if result.get('success'):
+                writer.add_result(result['pan_details'], result['registration_details'])
+                store.add(result['pan_details'], result['registration_details'])
+            else:
+                reason = failure_reason(result)
+                errors.append(f"PAN {pan_number}: {reason}")
+                # Add empty record for failed PAN, with the reason it failed
+                writer.add_result(failed_row(pan_number, reason))
+        
+        if profiler:
+            on_result = profiler.wrap('output', on_result)
+        
+        def on_requeue(pan_number, result):
+            self.stats.record_requeue()
+            self.log(f"Re-queued PAN {pan_number}: {result['message']}\n")
+        
+        self.runner = BatchRunner(self.pool, pan_list, workers=settings['sessions'],
+                                  max_requeues=settings['retries'], on_result=on_result,
+                                  on_requeue=on_requeue, on_wait=self.show_breaker_wait)
+        if self.processing:
+            self.runner.run()
+        
+        if deferred:
+            def on_round(round_number, pans, delay):
+                self.log(f"Second pass, round {round_number}: retrying {len(pans)} PANs on fresh sessions "
+                         f"in {delay:g}s\n")
+            
+            # Stopped batches skip the retries but still write the first-pass failures
+            retried = self.pool.retry_transient(deferred, should_continue=lambda: self.processing,
+                                                on_round=on_round, on_wait=self.show_breaker_wait)
+            for pan_number, result in retried.items():
+                on_result(pan_number, result)
+        return errors
+    
+    def refresh_stats(self):
+        """Update the statistics panel; reschedules itself while a batch runs"""
+        if self.stats is None:
+            return
+        pool = self.pool
+        stats = self.stats.snapshot(pool.requests_sent if pool else 0)
+        
+        self.stats_vars['pans_per_sec'].set(f"{stats['pans_per_sec']:.2f} ({stats['done']}/{stats['total']} done)")
+        self.stats_vars['requests_per_pan'].set(f"{stats['requests_per_pan']:.2f}")
+        self.stats_vars['success_rate'].set(
+            f"{stats['success_rate']:.1f}% ({stats['not_found']} no record, {stats['failed']} failed, "
+            f"{stats['requeued']} re-queued)")
+        self.stats_vars['cache_hit_rate'].set(f"{stats['cache_hit_rate']:.1f}%")
+        self.stats_vars['sessions'].set(pool.describe() if pool else "-")
+        self.stats_vars['hedging'].set(pool.hedging.describe() if pool else "-")
+        found = sum(count for _, count in stats['endpoints'])
+        self.stats_vars['endpoints'].set(
+            ', '.join(f"{name} {count} ({count / found * 100:.0f}%)" for name, count in stats['endpoints']) or "-")
+        
+        if self.processing:
+            self.root.after(STATS_REFRESH_MS, self.refresh_stats)
+    
+    def show_breaker_wait(self, breaker, delay):
+        """Report a paused batch while the portal circuit is open"""
+        self.log(f"Portal unavailable, batch paused: {breaker.describe()}\n")
+        self.root.after(0, lambda: self.status_label.config(text=f"Paused - {breaker.describe()}"))
+    
     def processing_complete(self, result):
         """Called when processing completes"""
         self.stop_processing()
+        self.refresh_stats()
         
         # Handle the new result structure
         total = result.get('total_processed', 0)
@@ -361,7 +554,10 @@ class PANScraperGUI:
         self.processing = False
         self.start_button.config(state="normal")
         self.stop_button.config(state="disabled")
+        self.apply_button.config(state="disabled")
         self.progress.stop()
+        if self.runner:
+            self.runner.stop()
         if hasattr(self, 'processing_thread'):
             # Note: We can't actually stop the thread, but we set the flag
             pass
@@ -372,6 +568,7 @@ class PANScraperGUI:
 
 def main():
     """Main function for GUI"""
+    configure_logging()
     root = tk.Tk()
     app = PANScraperGUI(root)
     root.mainloop()
@@ -0,0 +1,90 @@
+"""
+Hedged requests against slow portal responses
+A lookup POST that takes longer than the recent p95 latency gets a duplicate
+on another pooled connection; the first good answer is used. Hedges are
+capped at a share of all lookup requests so they add little load
+"""
+
+import math
+import threading
+from collections import deque
+
+
+class HedgePolicy:
+    def __init__(self, percentile=95, budget=0.05, window=200, min_samples=20, min_delay=0.05):
+        # A request is hedged once it has been running longer than this percentile of recent latencies
+        self.percentile = percentile
+        # Hedges may be at most this share of lookup requests (plus one, so the first slow request can hedge)
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = deque(maxlen=window)
+        self.current_delay = None
+        self.stale = True
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.over_budget = 0
+        # Seconds the winning hedge answered before its original request did (measured when the original finishes)
+        self.time_saved = 0.0
+        self.lock = threading.Lock()
+
+    def set_budget(self, budget):
+        with self.lock:
+            self.budget = budget
+
+    def record_latency(self, seconds):
+        """Latency of an original (unhedged) request, including ones that lost to a hedge"""
+        with self.lock:
+            self.latencies.append(seconds)
+            self.stale = True
+
+    def delay(self):
+        """How long to wait before hedging, or None while there are too few samples"""
+        with self.lock:
+            self.requests += 1
+            if len(self.latencies) < self.min_samples:
+                return None
+            if self.stale:
+                ordered = sorted(self.latencies)
+                index = min(len(ordered) - 1, math.ceil(len(ordered) * self.percentile / 100) - 1)
+                self.current_delay = max(self.min_delay, ordered[index])
+                self.stale = False
+            return self.current_delay
+
+    def try_hedge(self):
+        """Take one hedge from the budget; False when hedging now would exceed it"""
+        with self.lock:
+            if not self.budget or self.hedges + 1 > self.budget * self.requests + 1:
+                self.over_budget += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        with self.lock:
+            self.hedges_won += 1
+
+    def record_saving(self, seconds):
+        with self.lock:
+            self.time_saved += max(0.0, seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedges_won': self.hedges_won,
+                'over_budget': self.over_budget,
+                'time_saved': self.time_saved,
+                'delay': self.current_delay,
+            }
+
+    def describe(self):
+        if not self.budget:
+            return "off"
+        stats = self.snapshot()
+        share = stats['hedges'] / stats['requests'] * 100 if stats['requests'] else 0.0
+        return (f"{stats['hedges']} hedged ({share:.1f}% extra requests), {stats['hedges_won']} won, "
+                f"{stats['time_saved']:.1f}s saved")
@@ -0,0 +1,278 @@
+"""
+Import historical output workbooks
+Streams every pan_details_*/registration_details_* pair in a directory
+(newest run first, streaming the sheet XML), keeps the newest successful record of
+each PAN and seeds the record store and the result cache with them, so later
+runs can skip PANs that are already known
+
+    python history_import.py output
+    python history_import.py output archive/2024 --cache
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+from datetime import datetime
+
+from excel_writer import PAN_COLUMNS
+from normalization import intern_value
+from record_store import RecordStore, REGISTRATION_FIELDS
+
+RUN_PATTERN = re.compile(r'pan_details_(\d{8}_\d{6})\.xlsx$')
+# Columns whose values repeat across rows; interned so a large run does not hold thousands of copies
+REPEATED_COLUMNS = {'Status', 'Office', 'City Name', 'Fiscal Year/Return Verified Date', 'Type'}
+# A live result's pan_details (see get_empty_pan_details), so a batch answered from the cache fills every column
+PAN_DETAILS_FIELDS = [column for column in PAN_COLUMNS if column != 'Reason']
+# Records are written to the store and cache in chunks of this many
+CHUNK_SIZE = 5000
+
+
+def find_runs(directories):
+    """(run time, pan file, registration file or None) for every run found, newest first"""
+    runs = []
+    for directory in directories:
+        for pan_file in glob.glob(os.path.join(directory, '**', 'pan_details_*.xlsx'), recursive=True):
+            match = RUN_PATTERN.search(os.path.basename(pan_file))
+            if match:
+                run_time = datetime.strptime(match.group(1), '%Y%m%d_%H%M%S').timestamp()
+            else:
+                run_time = os.path.getmtime(pan_file)
+            reg_file = os.path.join(os.path.dirname(pan_file),
+                                    os.path.basename(pan_file).replace('pan_details_', 'registration_details_', 1))
+            runs.append((run_time, pan_file, reg_file if os.path.exists(reg_file) else None))
+    runs.sort(reverse=True)
+    return runs
+
+
+SPREADSHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+RELATIONSHIP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+CELL_TAG = f'{SPREADSHEET_NS}c'
+ROW_TAG = f'{SPREADSHEET_NS}row'
+TEXT_TAG = f'{SPREADSHEET_NS}t'
+VALUE_TAG = f'{SPREADSHEET_NS}v'
+INLINE_TEXT_PATH = f'{SPREADSHEET_NS}is/{TEXT_TAG}'
+
+
+def column_index(letters):
+    """0-based column of a cell reference's letters, e.g. 'C' for 'C12'"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def first_sheet_path(archive):
+    """Location of the first worksheet inside an .xlsx archive"""
+    import xml.etree.ElementTree as ElementTree
+
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find(f'{SPREADSHEET_NS}sheets/{SPREADSHEET_NS}sheet')
+    relationship_id = sheet.get(f'{RELATIONSHIP_NS}id')
+    relationships = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relationship in relationships:
+        if relationship.get('Id') == relationship_id:
+            target = relationship.get('Target')
+            return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    raise KeyError(relationship_id)
+
+
+def sheet_values(path):
+    """Rows of the first sheet as lists of raw values, parsed straight from the sheet XML
+
+    openpyxl's read-only mode builds an object per inline-string cell (which is how the
+    write-only ExcelResultWriter stores text) and manages only a few thousand rows a second
+    """
+    import xml.etree.ElementTree as ElementTree
+    import zipfile
+
+    with zipfile.ZipFile(path) as archive:
+        shared = []
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            with archive.open('xl/sharedStrings.xml') as f:
+                for _, element in ElementTree.iterparse(f):
+                    if element.tag == f'{SPREADSHEET_NS}si':
+                        shared.append(''.join(text.text or '' for text in element.iter(TEXT_TAG)))
+                        element.clear()
+
+        # Cell references repeat the same few column letters on every row
+        columns = {}
+        with archive.open(first_sheet_path(archive)) as f:
+            row = []
+            for _, element in ElementTree.iterparse(f):
+                tag = element.tag
+                if tag == CELL_TAG:
+                    reference = element.get('r')
+                    if reference:
+                        letters = reference.rstrip('0123456789')
+                        index = columns.get(letters)
+                        if index is None:
+                            index = columns[letters] = column_index(letters)
+                    else:
+                        index = len(row)
+                    kind = element.get('t')
+                    if kind == 'inlineStr':
+                        text = element.find(INLINE_TEXT_PATH)
+                        if text is not None and len(element[0]) == 1:
+                            value = text.text or ''
+                        else:
+                            # Rich text: the runs' texts joined
+                            value = ''.join(text.text or '' for text in element.iter(TEXT_TAG))
+                    else:
+                        raw = element.findtext(VALUE_TAG)
+                        if raw is None:
+                            value = None
+                        elif kind == 's':
+                            value = shared[int(raw)]
+                        elif kind in ('str', 'e'):
+                            value = raw
+                        elif kind == 'b':
+                            value = raw == '1'
+                        else:
+                            value = float(raw)
+                    if index > len(row):
+                        row.extend([None] * (index - len(row)))
+                    row.append(value)
+                elif tag == ROW_TAG:
+                    yield row
+                    row = []
+                    element.clear()
+
+
+def openpyxl_values(path):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """Stream the rows of a workbook's first sheet as dicts keyed by its header"""
+    try:
+        rows = sheet_values(path)
+        header = next(rows, None)
+    except (KeyError, AttributeError, ValueError) as e:
+        # Not laid out the way Excel and openpyxl write workbooks; let openpyxl deal with it
+        print(f"   {os.path.basename(path)}: {e}, reading with openpyxl")
+        rows = openpyxl_values(path)
+        header = next(rows, None)
+    if not header:
+        return
+
+    columns = [str(column).strip() if column is not None else '' for column in header]
+    for values in rows:
+        row = {}
+        for column, value in zip(columns, values):
+            if value is None:
+                value = ''
+            elif isinstance(value, float) and value.is_integer():
+                # PANs and wards typed as numbers in Excel come back as floats
+                value = str(int(value))
+            else:
+                value = str(value).strip()
+            row[column] = intern_value(value) if column in REPEATED_COLUMNS else value
+        yield row
+
+
+class HistoryImporter:
+    def __init__(self, store=None, cache=None):
+        self.store = store
+        self.cache = cache
+        self.seen = set()
+        self.rows = 0
+        self.imported = 0
+        self.stored = 0
+        self.cached = 0
+        self.runs = 0
+
+    def import_runs(self, runs, progress=None):
+        for run_time, pan_file, reg_file in runs:
+            self.import_run(run_time, pan_file, reg_file)
+            if progress:
+                progress(self, pan_file)
+
+    def import_run(self, run_time, pan_file, reg_file):
+        """Take the successful records of one run that no newer run has already supplied"""
+        records = {}
+        for row in read_rows(pan_file):
+            self.rows += 1
+            pan = row.get('PAN No', '')
+            if not pan or pan in self.seen or row.get('Status') != 'Success' or not row.get('Name'):
+                continue
+            pan_details = {key: row.get(key, '') for key in PAN_DETAILS_FIELDS}
+            # Older workbooks may have left the portal's PAN column empty; it is the PAN looked up
+            pan_details['PAN'] = pan_details['PAN'] or pan
+            # Within one run a later row is the later lookup
+            records[pan] = (pan_details, [])
+
+        if reg_file and records:
+            for row in read_rows(reg_file):
+                self.rows += 1
+                entry = records.get(row.get('PAN No', ''))
+                if entry is None:
+                    continue
+                registration = {'PAN No': row['PAN No'], **{key: row.get(key, '') for _, key in REGISTRATION_FIELDS}}
+                if registration not in entry[1]:
+                    entry[1].append(registration)
+
+        self.seen.update(records)
+        self.runs += 1
+        self.imported += len(records)
+        items = list(records.values())
+        for start in range(0, len(items), CHUNK_SIZE):
+            self.write_chunk(items[start:start + CHUNK_SIZE], run_time)
+
+    def write_chunk(self, chunk, run_time):
+        if self.store:
+            self.stored += self.store.add_many(chunk, run_time)
+        if self.cache:
+            self.cached += self.cache.put_many(
+                (pan_details['PAN No'],
+                 {'success': True, 'pan_details': pan_details, 'registration_details': registrations,
+                  'source': 'history'},
+                 run_time)
+                for pan_details, registrations in chunk)
+
+    def describe(self):
+        return (f"{self.runs} runs, {self.rows} rows read, {self.imported} distinct PANs found, "
+                f"{self.stored} written to the record store, {self.cached} cached")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the record store and result cache from past output workbooks")
+    parser.add_argument('directories', nargs='+', help="Directories searched (recursively) for pan_details_*.xlsx")
+    parser.add_argument('--store', default='pan_records.db', metavar='DB', help="Record store to fill")
+    parser.add_argument('--cache', action='store_true',
+                        help="Also seed pan_cache.jsonl (only records younger than the cache TTL are kept)")
+    args = parser.parse_args()
+
+    runs = find_runs(args.directories)
+    if not runs:
+        print("No pan_details_*.xlsx workbooks found")
+        return
+    print(f"Importing {len(runs)} runs, newest first...")
+
+    cache = None
+    if args.cache:
+        from result_cache import ResultCache
+        cache = ResultCache()
+    store = RecordStore(args.store)
+    importer = HistoryImporter(store=store, cache=cache)
+    started = time.time()
+
+    def progress(importer, pan_file):
+        print(f"   {os.path.basename(pan_file)}: {importer.describe()} ({time.time() - started:.0f}s)")
+
+    try:
+        importer.import_runs(runs, progress)
+    finally:
+        store.close()
+    print(f"\nDone in {time.time() - started:.0f}s: {importer.describe()}")
+    print("Later batches can skip these PANs with: python pan_search.py --file pans.csv --skip-known")
+
+if __name__ == "__main__":
+    main()
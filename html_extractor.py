@@ -0,0 +1,300 @@
+"""
+Single-pass HTML extraction for PAN result pages
+Walks the document once with the stdlib HTMLParser and fills the PAN and
+registration records the same way parse_text_patterns and parse_table_data do
+on a BeautifulSoup tree, without building the tree
+"""
+
+import re
+from html.entities import html5
+from html.parser import HTMLParser
+
+# Tags BeautifulSoup's get_text() leaves out, and tags it never treats as open
+SKIPPED_TEXT_TAGS = {'script', 'style', 'template'}
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+    'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+    'nextid', 'spacer'
+}
+# Tags whose whitespace-only strings BeautifulSoup keeps as they are; elsewhere they collapse
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+ASCII_SPACES = ' \n\t\x0c\r'
+
+# Named references as BeautifulSoup resolves them: with or without the semicolon, first spelling wins
+NAMED_ENTITIES = {}
+for _name, _character in sorted(html5.items()):
+    NAMED_ENTITIES.setdefault(_name.rstrip(';'), _character)
+NUMERIC_PREFIX = {10: re.compile('^([0-9]+)(.*)'), 16: re.compile('^([0-9a-f]+)(.*)')}
+
+
+def numeric_reference(number):
+    """Character for a numeric reference, with the HTML spec's replacements (as UnicodeDammit does)"""
+    if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+        return '\ufffd'
+    if 0x80 <= number <= 0x9f:
+        # C1 controls are almost always Windows-1252 bytes written as references
+        try:
+            return bytes([number]).decode('cp1252')
+        except UnicodeDecodeError:
+            pass
+    return chr(number)
+
+# Labels the portal uses, resolved once; other labels are classified on first sight and remembered
+KNOWN_LABELS = [
+    'Office', 'PAN', 'PAN No', 'PAN No.', 'Name', 'Name (Eng)', 'Name (Nep)', 'Telephone', 'Phone', 'Mobile',
+    'Ward', 'Ward No', 'Street', 'Street Name', 'City', 'City Name', 'Fiscal Year', 'Return Verified Date',
+    'Fiscal Year/Return Verified Date', 'Type', 'Reg. Date', 'Status',
+]
+MAX_LEARNED_LABELS = 4096
+
+REGISTRATION_HEADERS = ('Type', 'Reg. Date', 'Status')
+
+
+def classify_table_label(key_lower):
+    """Field for a table row label (the parse_table_data rules)"""
+    if 'office' in key_lower:
+        return 'Office'
+    if 'pan' in key_lower and 'no' not in key_lower:
+        return 'PAN'
+    if 'name' in key_lower and 'street' not in key_lower and 'city' not in key_lower:
+        return 'Name'
+    if 'telephone' in key_lower or 'phone' in key_lower:
+        return 'Telephone'
+    if 'ward' in key_lower:
+        return 'Ward'
+    if 'street' in key_lower:
+        return 'Street Name'
+    if 'city' in key_lower:
+        return 'City Name'
+    if 'fiscal' in key_lower or 'return' in key_lower:
+        return 'Fiscal Year/Return Verified Date'
+    return None
+
+
+def classify_text_label(key_lower):
+    """Field for a tab separated text label (the parse_text_patterns rules)"""
+    for needle, field in (('office', 'Office'), ('pan', 'PAN'), ('name', 'Name'), ('telephone', 'Telephone'),
+                          ('ward', 'Ward'), ('street', 'Street Name'), ('city', 'City Name')):
+        if needle in key_lower:
+            return field
+    return None
+
+
+class LabelTable:
+    """Label -> field lookup table, precomputed for known labels and memoized for the rest"""
+
+    def __init__(self, classify):
+        self.classify = classify
+        self.fields = {}
+        for label in KNOWN_LABELS:
+            self.lookup(label)
+
+    def lookup(self, label):
+        try:
+            return self.fields[label]
+        except KeyError:
+            field = self.classify(label.lower())
+            if len(self.fields) < MAX_LEARNED_LABELS:
+                self.fields[label] = field
+            return field
+
+
+TABLE_LABELS = LabelTable(classify_table_label)
+TEXT_LABELS = LabelTable(classify_text_label)
+
+
+class SinglePassParser(HTMLParser):
+    """Collects page text and table cells in one walk, mirroring BeautifulSoup's html.parser tree"""
+
+    def __init__(self):
+        # References are resolved here, as BeautifulSoup's tree builder does, not by HTMLParser
+        super().__init__(convert_charrefs=False)
+        self.text = []
+        self.tables = []
+        self.stack = []
+        self.skip_depth = 0
+        self.preserve_depth = 0
+        # Data since the last markup event; BeautifulSoup makes one string of it
+        self.pending = []
+        # Void tags closed at their start tag; one matching end tag each is dropped without ending a string
+        self.closed_void_tags = []
+        self.open_tables = []
+        self.open_rows = []
+        self.open_cells = []
+
+    def handle_starttag(self, tag, attrs):
+        self.end_data()
+        if tag in VOID_TAGS:
+            self.closed_void_tags.append(tag)
+            return
+        self.stack.append(tag)
+
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self.preserve_depth += 1
+        if tag in SKIPPED_TEXT_TAGS:
+            self.skip_depth += 1
+        elif tag == 'table':
+            table = []
+            self.tables.append(table)
+            self.open_tables.append(table)
+        elif tag == 'tr':
+            # Rows belong to every enclosing table, as with table.find_all('tr')
+            row = []
+            for table in self.open_tables:
+                table.append(row)
+            self.open_rows.append(row)
+        elif tag == 'td' or tag == 'th':
+            cell = []
+            for row in self.open_rows:
+                row.append(cell)
+            self.open_cells.append(cell)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in VOID_TAGS:
+            # <br/> needs no end tag, so a later </br> is not redundant
+            self.closed_void_tags.remove(tag)
+        else:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void_tags:
+            self.closed_void_tags.remove(tag)
+            return
+        self.end_data()
+        # Close everything up to the most recent open tag of this name; stray end tags are ignored
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index] == tag:
+                break
+        else:
+            return
+
+        while len(self.stack) > index:
+            closed = self.stack.pop()
+            if closed in PRESERVE_WHITESPACE_TAGS:
+                self.preserve_depth -= 1
+            if closed in SKIPPED_TEXT_TAGS:
+                self.skip_depth -= 1
+            elif closed == 'table':
+                self.open_tables.pop()
+            elif closed == 'tr':
+                self.open_rows.pop()
+            elif closed == 'td' or closed == 'th':
+                self.open_cells.pop()
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_entityref(self, name):
+        # Unknown names stay literal text
+        self.pending.append(NAMED_ENTITIES.get(name, '&' + name))
+
+    def handle_charref(self, name):
+        base = 16 if name[:1] in ('x', 'X') else 10
+        digits = name[1:] if base == 16 else name
+        try:
+            number, rest = int(digits, base), ''
+        except ValueError:
+            # A reference without its semicolon runs into the text after it
+            match = NUMERIC_PREFIX[base].search(digits)
+            if match is None:
+                self.pending.append(digits)
+                return
+            number, rest = int(match.group(1), base), match.group(2)
+        self.pending.append(numeric_reference(number))
+        self.pending.append(rest)
+
+    def end_data(self):
+        """Add the pending data as one string, as BeautifulSoup's endData does"""
+        if not self.pending:
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        if not self.preserve_depth and not data.strip(ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        if self.skip_depth:
+            return
+        self.text.append(data)
+        if self.open_cells:
+            stripped = data.strip()
+            if stripped:
+                for cell in self.open_cells:
+                    cell.append(stripped)
+
+    def handle_comment(self, data):
+        # Comments are left out of the text but still end a string
+        self.end_data()
+
+    def handle_decl(self, decl):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def unknown_decl(self, data):
+        self.end_data()
+        if data.upper().startswith('CDATA['):
+            self.handle_data(data[6:])
+            self.end_data()
+
+    def close(self):
+        super().close()
+        self.end_data()
+
+
+def extract_text_records(page_text, pan_details, registration_details, pan_number):
+    """Section-aware scan of tab separated lines in the page text"""
+    in_pan_details = False
+    in_registration = False
+
+    for line in page_text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        line_lower = line.lower()
+        if 'pan details' in line_lower:
+            in_pan_details, in_registration = True, False
+            continue
+        if 'registration details' in line_lower:
+            in_pan_details, in_registration = False, True
+            continue
+        if 'latest tax clearance' in line_lower:
+            in_pan_details = in_registration = False
+            continue
+
+        if '\t' not in line or not (in_pan_details or in_registration):
+            continue
+
+        parts = line.split('\t')
+        if in_pan_details and len(parts) >= 2:
+            field = TEXT_LABELS.lookup(parts[0].strip())
+            if field:
+                pan_details[field] = parts[1].strip()
+        elif in_registration and len(parts) >= 3 and parts[0].strip() not in REGISTRATION_HEADERS:
+            registration_details.append({
+                'PAN No': pan_number,
+                'Type': parts[0].strip(),
+                'Reg. Date': parts[1].strip(),
+                'Status': parts[2].strip()
+            })
+
+
+def extract_table_records(tables, pan_details):
+    """Label/value rows of every table, in document order"""
+    for table in tables:
+        for row in table:
+            if len(row) >= 2:
+                field = TABLE_LABELS.lookup(''.join(row[0]))
+                if field:
+                    pan_details[field] = ''.join(row[1])
+
+
+def extract_html_records(content, pan_details, registration_details, pan_number):
+    """Fill PAN and registration records from a result page in a single pass"""
+    parser = SinglePassParser()
+    parser.feed(content)
+    parser.close()
+
+    extract_text_records(''.join(parser.text), pan_details, registration_details, pan_number)
+    extract_table_records(parser.tables, pan_details)
@@ -0,0 +1,118 @@
+"""
+Local stand-in for the IRD PAN search portal
+Serves the search page (CSRF token, arithmetic captcha, session cookies) and
+JSON answers on the lookup endpoints, for soak tests and offline experiments
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+OFFICES = ['IRO Kathmandu', 'IRO Lalitpur', 'Taxpayer Service Office Baneshwor', 'IRO Pokhara', 'IRO Biratnagar']
+CITIES = ['Kathmandu', 'Lalitpur', 'Bhaktapur', 'Pokhara', 'Biratnagar']
+LOOKUP_PATHS = ('/panDetails', '/panRegistrationDetail', '/panTaxClearance', '/statstics/getPanSearch')
+
+
+def fake_lookup(pan, no_record_rate):
+    """Deterministic portal answer for one PAN"""
+    rng = random.Random(pan)
+    if rng.random() < no_record_rate:
+        return {'panDetails': [], 'panRegistrationDetail': [], 'panTaxClearance': []}
+    return {
+        'panDetails': [{'pan': pan, 'trade_Name_Eng': f"Trader {pan} Pvt. Ltd.", 'office_Name': rng.choice(OFFICES),
+                        'telephone': f"01-{rng.randint(4000000, 5999999)}", 'ward_No': str(rng.randint(1, 32)),
+                        'street_Name': f"Street {rng.randint(1, 500)}", 'vdc_Town': rng.choice(CITIES)}],
+        'panRegistrationDetail': [
+            {'acctType': rng.choice(['0', '10', '20', '30']), 'accountStatus': rng.choice('AIC'),
+             'registrationDate': f"20{rng.randint(60, 80)}.{rng.randint(1, 12):02d}.{rng.randint(1, 30):02d}"}
+            for _ in range(rng.randint(1, 3))
+        ],
+        'panTaxClearance': [{'fiscal_Year': '2080/081', 'return_Verified_Date': '2081.03.15'}],
+    }
+
+
+class MockPortalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in one write; separate small writes stall on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body, content_type='application/json'):
+        portal = self.server.portal
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        # Laravel rotates these two on every response; cookie_churn adds a new name each time
+        self.send_header('Set-Cookie', f"XSRF-TOKEN={random.getrandbits(64):x}; Path=/")
+        self.send_header('Set-Cookie', f"laravel_session={random.getrandbits(64):x}; Path=/; HttpOnly")
+        if portal.cookie_churn:
+            self.send_header('Set-Cookie', f"tracker_{portal.requests}={random.getrandbits(32):x}; Path=/")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def handle_request(self):
+        portal = self.server.portal
+        with portal.lock:
+            portal.requests += 1
+        if portal.latency:
+            # slow_rate of the responses form a tail at 20 times the usual latency
+            tail = 20 if portal.slow_rate and random.random() < portal.slow_rate else 1
+            time.sleep(random.uniform(0.5, 1.5) * portal.latency * tail)
+        if portal.error_rate and random.random() < portal.error_rate:
+            return self.reply(503, 'Service Unavailable', 'text/plain')
+
+        if self.command == 'GET':
+            a, b = random.randint(1, 20), random.randint(1, 20)
+            page = (f'<html><body><form><input type="hidden" name="_token" value="{random.getrandbits(128):032x}">'
+                    f'<label>What is {a} + {b} ?</label><input name="captcha"></form></body></html>')
+            return self.reply(200, page, 'text/html')
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            fields = json.loads(body or '{}')
+        else:
+            fields = {key: values[0] for key, values in parse_qs(body).items()}
+        pan = str(fields.get('pan') or fields.get('panNumber') or fields.get('pan_number') or '')
+
+        if self.path.split('?')[0] not in LOOKUP_PATHS or not pan or ',' in pan:
+            return self.reply(404, 'Not Found', 'text/plain')
+        return self.reply(200, json.dumps(fake_lookup(pan, portal.no_record_rate)))
+
+    do_GET = do_POST = handle_request
+
+
+class MockPortal:
+    def __init__(self, latency=0.0, no_record_rate=0.15, error_rate=0.0, cookie_churn=False, port=0, slow_rate=0.0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.no_record_rate = no_record_rate
+        self.error_rate = error_rate
+        self.cookie_churn = cookie_churn
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), MockPortalHandler)
+        self.server.daemon_threads = True
+        self.server.portal = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mock-portal', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
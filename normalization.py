@@ -0,0 +1,90 @@
+"""
+Reference normalization for parsed PAN records
+Module-level code tables, interning of the free-text values that repeat across
+records (offices, towns, streets) and optional canonical office/city names
+"""
+
+import re
+import sys
+from functools import lru_cache
+
+ACCOUNT_TYPES = {
+    '0': 'VAT',
+    '10': 'Income Tax',
+    '20': 'EXCISE',
+    '30': 'Service Tax'
+}
+ACCOUNT_STATUSES = {'A': 'Active', 'I': 'Inactive', 'C': 'Cancelled'}
+
+# Fields whose values repeat across many records; each distinct value is stored once
+SHARED_FIELDS = ('Office', 'Ward', 'Street Name', 'City Name', 'Fiscal Year/Return Verified Date')
+
+# Alternative spellings mapped to one name, keyed by the lower-cased, space-collapsed form
+OFFICE_ALIASES = {
+    'tax payer service office': 'Taxpayer Service Office',
+    'tax payers service office': 'Taxpayer Service Office',
+    'large taxpayers office': 'Large Taxpayers Office',
+    'ltpo': 'Large Taxpayers Office',
+}
+CITY_ALIASES = {
+    'ktm': 'Kathmandu',
+    'kathmandu metropolitan city': 'Kathmandu',
+    'lalitpur metropolitan city': 'Lalitpur',
+    'patan': 'Lalitpur',
+    'pokhara metropolitan city': 'Pokhara',
+    'biratnagar metropolitan city': 'Biratnagar',
+}
+
+WHITESPACE = re.compile(r'\s+')
+CANONICAL_CACHE_SIZE = 65536
+
+
+def account_type_name(code):
+    code = str(code)
+    return ACCOUNT_TYPES.get(code) or intern_value(f"Type {code}")
+
+
+def account_status_name(code):
+    return ACCOUNT_STATUSES.get(code, code)
+
+
+def intern_value(value):
+    """Share one copy of a repeated string across all records"""
+    return sys.intern(value) if type(value) is str else value
+
+
+def collapse(value):
+    return WHITESPACE.sub(' ', value).strip(' ,.')
+
+
+@lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def canonical_office(name):
+    """Canonical office name: collapsed whitespace and known aliases; the portal's casing is kept"""
+    cleaned = collapse(name)
+    return sys.intern(OFFICE_ALIASES.get(cleaned.lower(), cleaned))
+
+
+@lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def canonical_city(name):
+    """Canonical city name: collapsed whitespace, known aliases and title case for ALL-CAPS input"""
+    cleaned = collapse(name)
+    alias = CITY_ALIASES.get(cleaned.lower())
+    if alias:
+        return alias
+    if cleaned.isupper() or cleaned.islower():
+        cleaned = cleaned.title()
+    return sys.intern(cleaned)
+
+
+def normalize_pan_details(pan_details, canonicalize=False):
+    """Intern repeated values in place and optionally canonicalize office and city names"""
+    for field in SHARED_FIELDS:
+        value = pan_details.get(field)
+        if type(value) is not str or not value:
+            continue
+        if canonicalize and field == 'Office':
+            value = canonical_office(value)
+        elif canonicalize and field == 'City Name':
+            value = canonical_city(value)
+        pan_details[field] = intern_value(value)
+    return pan_details
@@ -0,0 +1,63 @@
+"""
+Search the local record store (pan_records.db) built up by batch runs
+
+    python pan_query.py --name "yellow house"
+    python pan_query.py --city Kathmandu --type VAT --status Active
+    python pan_query.py 602621654
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from record_store import RecordStore
+
+
+def print_record(record):
+    details = record['pan_details']
+    print(f"{details['PAN No']}  {details['Name']}")
+    print(f"   {details['Office']} | {details['Street Name']}, Ward {details['Ward']}, {details['City Name']}"
+          f" | {details['Telephone']}")
+    for registration in record['registration_details']:
+        print(f"   • {registration['Type']}: {registration['Status']} (since {registration['Reg. Date']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search scraped PAN records without opening the Excel outputs")
+    parser.add_argument('pan', nargs='?', help="Look up one PAN")
+    parser.add_argument('--name', help="Words in the name (prefix match, any order)")
+    parser.add_argument('--office', help="Exact office name")
+    parser.add_argument('--city', help="Exact city name")
+    parser.add_argument('--type', dest='reg_type', help="Registration type, e.g. VAT")
+    parser.add_argument('--status', dest='reg_status', help="Registration status, e.g. Active")
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help="One JSON object per record")
+    parser.add_argument('--db', default='pan_records.db', help="Record store to search")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"No record store at {args.db}; batch runs create it")
+        sys.exit(1)
+    if not any((args.pan, args.name, args.office, args.city, args.reg_type, args.reg_status)):
+        parser.error("give a PAN or at least one search criterion")
+
+    store = RecordStore(args.db)
+    started = time.perf_counter()
+    records = store.search(name=args.name, office=args.office, city=args.city, reg_type=args.reg_type,
+                           reg_status=args.reg_status, pan=args.pan, limit=args.limit)
+    elapsed = (time.perf_counter() - started) * 1000
+    store.close()
+
+    for record in records:
+        if args.json:
+            print(json.dumps(record, ensure_ascii=False))
+        else:
+            print_record(record)
+    if not args.json:
+        more = " (limit reached)" if len(records) == args.limit else ""
+        print(f"\n{len(records)} record(s){more} in {elapsed:.1f} ms")
+
+if __name__ == "__main__":
+    main()
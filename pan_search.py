@@ -3,16 +3,28 @@ Simple PAN Scraper - IRD Nepal
 Clean and easy-to-use PAN number lookup tool
 """
 
-from ajax_scraper import AjaxPANScraper
-import pandas as pd
+from ajax_scraper import AjaxPANScraper, DEFAULT_BASE_URL, failure_reason, is_transient_failure
+from result_cache import ResultCache
+from circuit_breaker import CircuitBreaker, MAX_REQUEUES
+from session_pool import SessionPool
+from replay import ResponseRecorder
+from excel_writer import ExcelResultWriter, failed_row
+from sweep import Sweep
+from egress import EgressPool
+from hedging import HedgePolicy
+from record_store import RecordStore
+from profiling import RunProfiler
+from structured_log import configure_logging
+import logging
+from collections import Counter, deque
 import os
-from datetime import datetime
+import time
 
 def search_single_pan(pan_number):
     """Search for a single PAN number"""
     print(f"Searching for PAN: {pan_number}")
     
-    scraper = AjaxPANScraper()
+    scraper = AjaxPANScraper(cache=ResultCache())
     result = scraper.search_pan_ajax(str(pan_number))
     
     if result['success']:
@@ -37,81 +49,194 @@ def search_single_pan(pan_number):
         
         return result
     else:
-        print("FAILED: No data found or invalid PAN")
+        if result.get('not_found'):
+            print("FAILED: No record exists for this PAN")
+        elif result.get('retry'):
+            print(f"FAILED: {result['message']}, try again later")
+        else:
+            print(f"FAILED: {failure_reason(result)}")
         return None
 
-def search_multiple_pans(pan_list, save_to_excel=True):
-    """Search for multiple PAN numbers"""
-    print(f"Searching for {len(pan_list)} PAN numbers...")
+def search_multiple_pans(pan_list, save_to_excel=True, sessions=1, delay=3, record_to=None, bulk_size=0,
+                         canonicalize=False, cache=None, sweep=None, egress_pool=None, base_url=DEFAULT_BASE_URL,
+                         collect_results=True, pipeline=True, hedging=None, store=None, profile=False):
+    """Search for multiple PAN numbers, spread over a pool of sessions
+    
+    Returns the PAN and registration rows; with collect_results=False they are only
+    streamed to Excel and two empty lists are returned, so memory stays flat on long runs.
+    With profile=True lookups and output are profiled into profile_<timestamp>.* files
+    """
+    print(f"Searching for {len(pan_list)} PAN numbers using {sessions} session(s)...")
     
-    scraper = AjaxPANScraper()
+    # Each session waits `delay` seconds between its own lookups
+    recorder = ResponseRecorder(record_to) if record_to else None
+    profiler = RunProfiler('.') if profile else None
+    pool = SessionPool(size=sessions, min_interval=delay, cache=cache or ResultCache(), recorder=recorder,
+                       canonicalize=canonicalize, egress_pool=egress_pool, base_url=base_url, pipeline=pipeline,
+                       hedging=hedging, profiler=profiler)
     all_pan_details = []
     all_registrations = []
+    successful = failed = 0
+    reasons = Counter()
     
-    for i, pan in enumerate(pan_list, 1):
-        print(f"\n📊 Progress: {i}/{len(pan_list)} - PAN: {pan}")
-        
-        result = scraper.search_pan_ajax(str(pan))
-        
+    # Workbooks are written by a background thread as results arrive
+    writer = ExcelResultWriter('.', timestamp=profiler and profiler.timestamp,
+                               profiler=profiler) if save_to_excel else None
+    
+    # Connections (and TLS) are opened before the first PAN; with pipelining the first tokens are fetched too
+    pool.warm_up()
+    
+    # Answer what we can with multi-PAN requests first; misses fall through to per-PAN lookups
+    bulk_results = {}
+    if bulk_size > 1:
+        print(f"Trying bulk lookups in groups of {bulk_size}...")
+        bulk_results = pool.search_bulk([str(pan) for pan in pan_list], bulk_size)
+        print(f"Bulk lookups answered {len(bulk_results)} of {len(pan_list)} PANs")
+    
+    def record(pan, result):
+        nonlocal successful, failed
+        if sweep:
+            change = sweep.observe(pan, result)
+            if change:
+                print(f"   Delta: {change['change']}")
         if result['success']:
             print(f"   Success: {result['pan_details']['Name']}")
-            all_pan_details.append(result['pan_details'])
-            all_registrations.extend(result['registration_details'])
+            successful += 1
+            if collect_results:
+                all_pan_details.append(result['pan_details'])
+                all_registrations.extend(result['registration_details'])
+            if writer:
+                writer.add_result(result['pan_details'], result['registration_details'])
+            if store:
+                store.add(result['pan_details'], result['registration_details'])
         else:
-            print(f"   Failed: No data found")
+            reason = failure_reason(result)
+            print(f"   Failed: {reason}")
             # Add failed entry
-            failed_entry = {
-                'PAN No': pan,
-                'Status': 'Failed',
-                'Office': '',
-                'PAN': '',
-                'Name': '',
-                'Telephone': '',
-                'Ward': '',
-                'Street Name': '',
-                'City Name': '',
-                'Fiscal Year/Return Verified Date': ''
-            }
-            all_pan_details.append(failed_entry)
+            failed_entry = failed_row(pan, reason)
+            failed += 1
+            reasons[reason] += 1
+            if collect_results:
+                all_pan_details.append(failed_entry)
+            if writer:
+                writer.add_result(failed_entry)
+    
+    if profiler:
+        record = profiler.wrap('output', record)
+    
+    # PANs hit by a portal outage go back to the front of the queue
+    pending = deque(pan_list)
+    requeues = {}
+    # Transient failures (bad token or captcha, timeouts...) wait for the second pass
+    deferred = {}
+    i = 0
+    
+    while pending:
+        if pool.breaker.state != CircuitBreaker.CLOSED:
+            pool.wait_for_portal(
+                on_wait=lambda breaker, delay: print(f"\n⏸  Portal unavailable, {breaker.describe()}")
+            )
         
-        # Add delay between requests
-        if i < len(pan_list):
-            import time
-            time.sleep(3)
-    
-    # Save to Excel if requested
-    if save_to_excel and all_pan_details:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        pan = pending.popleft()
+        print(f"\n📊 Progress: {i + 1}/{len(pan_list)} - PAN: {pan} [{pool.describe()}]")
         
-        # Save PAN details
-        df_pan = pd.DataFrame(all_pan_details)
-        pan_file = f'pan_details_{timestamp}.xlsx'
-        df_pan.to_excel(pan_file, index=False)
-        print(f"\n📁 PAN details saved to: {pan_file}")
+        result = bulk_results.pop(str(pan), None) or pool.search(str(pan))
+        
+        if result.get('retry') and requeues.get(pan, 0) < MAX_REQUEUES:
+            requeues[pan] = requeues.get(pan, 0) + 1
+            print(f"   Re-queued: {result['message']}")
+            pending.appendleft(pan)
+            continue
+        
+        i += 1
+        if is_transient_failure(result):
+            print(f"   Failed: {failure_reason(result)}, retried in the second pass")
+            deferred[pan] = result
+            continue
+        record(pan, result)
+    
+    if deferred:
+        def on_round(round_number, pans, delay):
+            print(f"\n🔄 Second pass, round {round_number}: retrying {len(pans)} PAN(s) on fresh sessions "
+                  f"in {delay:g}s")
         
-        # Save registrations
-        if all_registrations:
-            df_reg = pd.DataFrame(all_registrations)
-            reg_file = f'registration_details_{timestamp}.xlsx'
-            df_reg.to_excel(reg_file, index=False)
+        retried = pool.retry_transient({str(pan): result for pan, result in deferred.items()}, on_round=on_round)
+        for pan in deferred:
+            print(f"\n📊 Second pass - PAN: {pan}")
+            record(pan, retried[str(pan)])
+    
+    pool.close()
+    if store:
+        store.commit()
+    if recorder:
+        recorder.close()
+        print(f"\n📼 Responses recorded to: {record_to}")
+    
+    # Finish the Excel files
+    if writer:
+        pan_file, reg_file = writer.close()
+        if pan_file:
+            print(f"\n📁 PAN details saved to: {pan_file}")
+        if reg_file:
             print(f"📁 Registration details saved to: {reg_file}")
     
+    if profiler:
+        pstats_file, collapsed_file = profiler.save()
+        if pstats_file:
+            print(f"📁 Profile saved to: {pstats_file}")
+        print(f"📁 Stack samples saved to: {collapsed_file}")
+        print("   Most time spent in (own time):")
+        for function, own, calls in profiler.top():
+            print(f"     {own:7.3f}s {calls:7d}x  {function}")
+    
+    if sweep:
+        delta_file = sweep.finish()
+        print(f"\n🔁 Sweep: {sweep.describe()}")
+        print(f"📁 Delta saved to: {delta_file}" if delta_file else "   No changes since the last sweep")
+    
     # Print summary
-    successful = len([p for p in all_pan_details if p['Status'] == 'Success'])
-    failed = len(all_pan_details) - successful
+    total = successful + failed
     
     print(f"\n📈 SUMMARY:")
-    print(f"   Total: {len(all_pan_details)}")
+    print(f"   Total: {total}")
     print(f"   Successful: {successful}")
     print(f"   Failed: {failed}")
-    print(f"   Success Rate: {successful/len(all_pan_details)*100:.1f}%")
+    for reason, count in reasons.most_common():
+        print(f"     {reason}: {count}")
+    if deferred:
+        recovered = sum(1 for pan in deferred if not is_transient_failure(retried[str(pan)]))
+        print(f"   Second pass: {recovered} of {len(deferred)} transient failures resolved")
+    print(f"   Success Rate: {successful/total*100:.1f}%")
+    print(f"   Requests per PAN: {pool.requests_sent/total:.2f}")
+    if egress_pool:
+        print(f"   Egress:")
+        for line in egress_pool.report():
+            print(f"     {line}")
+    if hedging:
+        print(f"   Hedging: {hedging.describe()}")
     
     return all_pan_details, all_registrations
 
+def run_sweeps(pan_list, snapshot_path, every=None, output_dir='.', **search_options):
+    """Sweep the portfolio against a snapshot, writing only deltas; repeats every `every` minutes if given"""
+    # Sweeps must see the portal's current state, so results are only cached within one sweep
+    while True:
+        started = time.time()
+        sweep = Sweep(snapshot_path, output_dir)
+        search_multiple_pans(pan_list, save_to_excel=False, cache=ResultCache(cache_file=None), sweep=sweep,
+                             collect_results=False, **search_options)
+        if not every:
+            return
+        wait = started + every * 60 - time.time()
+        if wait > 0:
+            print(f"\n⏰ Next sweep in {wait / 60:.1f} minutes")
+            time.sleep(wait)
+
 def load_pans_from_file(filename):
     """Load PAN numbers from CSV or text file"""
     try:
         if filename.endswith('.csv'):
+            import pandas as pd
             df = pd.read_csv(filename)
             # Try to find PAN column
             pan_column = None
@@ -132,8 +257,92 @@ def load_pans_from_file(filename):
         print(f"Error loading file {filename}: {e}")
         return []
 
-def main():
-    """Main interactive function"""
+def parse_args(argv=None):
+    """Parse command line arguments; with none given the interactive menu runs"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="PAN Scraper - IRD Nepal")
+    parser.add_argument('pans', nargs='*', help="PAN numbers to search")
+    parser.add_argument('-f', '--file', help="CSV/TXT file with PAN numbers")
+    parser.add_argument('--sessions', type=int, default=1, help="Independent sessions to spread PANs across")
+    parser.add_argument('--delay', type=float, default=3, help="Seconds between lookups on one session")
+    parser.add_argument('--bulk', type=int, default=0, metavar='N',
+                        help="Try multi-PAN requests of N PANs before per-PAN lookups")
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help="Fetch each PAN's token and captcha only when its lookup starts")
+    parser.add_argument('--hedge', type=float, default=0, metavar='PERCENT',
+                        help="Duplicate lookup requests slower than the recent p95, up to PERCENT extra requests")
+    parser.add_argument('--canonicalize', action='store_true',
+                        help="Map office and city spellings to canonical names")
+    parser.add_argument('--proxies', metavar='FILE', help="Route sessions through the HTTP proxies listed in FILE")
+    parser.add_argument('--proxy-mode', choices=['session', 'request'], default='session',
+                        help="Keep one proxy per session, or rotate proxies on every request")
+    parser.add_argument('--record', metavar='ARCHIVE', help="Record lookup responses to a .jsonl.gz archive for replay.py")
+    parser.add_argument('--sweep', metavar='SNAPSHOT',
+                        help="Compare against a snapshot file and write only new/changed/removed records")
+    parser.add_argument('--every', type=float, metavar='MINUTES', help="With --sweep, repeat the sweep on this schedule")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Scraper log level; DEBUG shows every endpoint and payload attempt")
+    parser.add_argument('--log-json', metavar='FILE',
+                        help="Write one JSON line per PAN (outcome, requests, timings) to FILE, or '-' for stderr")
+    parser.add_argument('--store', default='pan_records.db', metavar='DB',
+                        help="Keep found records in this searchable store (see pan_query.py)")
+    parser.add_argument('--no-store', action='store_true', help="Do not keep found records in the record store")
+    parser.add_argument('--skip-known', action='store_true',
+                        help="Skip PANs the record store already has (e.g. imported with history_import.py)")
+    parser.add_argument('--no-excel', action='store_true', help="Do not save batch results to Excel")
+    parser.add_argument('--profile', action='store_true',
+                        help="Profile lookups and output; writes profile_<timestamp>.pstats and .collapsed")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main entry point: command line arguments or the interactive menu"""
+    args = parse_args(argv)
+    configure_logging(getattr(logging, args.log_level), lookup_log=args.log_json)
+    
+    if args.file or args.pans:
+        pans = list(args.pans)
+        if args.file:
+            if not os.path.exists(args.file):
+                print("File not found")
+                return
+            pans.extend(load_pans_from_file(args.file))
+        
+        egress_pool = EgressPool.from_file(args.proxies, per_request=args.proxy_mode == 'request') if args.proxies else None
+        hedging = HedgePolicy(budget=args.hedge / 100) if args.hedge > 0 else None
+        store = None if args.no_store or len(pans) < 2 else RecordStore(args.store)
+        if args.skip_known and os.path.exists(args.store):
+            known_store = store or RecordStore(args.store)
+            known = known_store.known_pans(pans)
+            if known:
+                pans = [pan for pan in pans if str(pan).strip() not in known]
+                print(f"Skipping {len(known)} PANs already in {args.store}")
+            if known_store is not store:
+                known_store.close()
+            if known and not pans:
+                print("Nothing left to search")
+                if store:
+                    store.close()
+                return
+        
+        if args.sweep and pans:
+            run_sweeps(pans, args.sweep, every=args.every, sessions=args.sessions, delay=args.delay,
+                       record_to=args.record, bulk_size=args.bulk, canonicalize=args.canonicalize,
+                       egress_pool=egress_pool, pipeline=not args.no_pipeline, hedging=hedging, store=store,
+                       profile=args.profile)
+        elif len(pans) == 1:
+            search_single_pan(pans[0])
+        elif pans:
+            search_multiple_pans(pans, save_to_excel=not args.no_excel,
+                                 sessions=args.sessions, delay=args.delay, record_to=args.record, bulk_size=args.bulk,
+                                 canonicalize=args.canonicalize, egress_pool=egress_pool, collect_results=False,
+                                 pipeline=not args.no_pipeline, hedging=hedging, store=store, profile=args.profile)
+        else:
+            print("No valid PAN numbers found in file")
+        if store:
+            store.close()
+        return
+    
     print("PAN Scraper - IRD Nepal")
     print("=" * 40)
     print("1. Search single PAN")
@@ -160,7 +369,11 @@ def main():
             pans.append(pan)
         
         if pans:
-            search_multiple_pans(pans)
+            store = RecordStore(args.store)
+            try:
+                search_multiple_pans(pans, store=store)
+            finally:
+                store.close()
         else:
             print("No PAN numbers entered")
     
@@ -170,7 +383,11 @@ def main():
             pans = load_pans_from_file(filename)
             if pans:
                 print(f"Loaded {len(pans)} PAN numbers from file")
-                search_multiple_pans(pans)
+                store = RecordStore(args.store)
+                try:
+                    search_multiple_pans(pans, store=store)
+                finally:
+                    store.close()
             else:
                 print("No valid PAN numbers found in file")
         else:
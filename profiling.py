@@ -0,0 +1,143 @@
+"""
+Run profiling
+With --profile (or the GUI's profile checkbox) lookups, token prefetches and the
+output stage run under cProfile (one profiler per thread) while a sampler
+thread records their stacks every few milliseconds. Each run leaves two files
+next to its Excel outputs:
+
+    profile_<timestamp>.pstats      python -m pstats, snakeviz
+    profile_<timestamp>.collapsed   flamegraph.pl, speedscope
+
+Both measure wall-clock time, so time spent waiting on the portal shows up in
+socket reads; parsing, regex and logging costs are the frames around them.
+
+Nothing is wrapped when profiling is off
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+
+class RunProfiler:
+    def __init__(self, output_dir='.', timestamp=None, interval=SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.interval = interval
+        self.local = threading.local()
+        self.profiles = []
+        # Thread ident -> stage, for threads currently inside a profiled call
+        self.active = {}
+        self.samples = Counter()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, name='profile-sampler', daemon=True)
+        self.sampler.start()
+
+    def run(self, stage, function, *args, **kwargs):
+        """Call function(*args, **kwargs), profiled as part of `stage`"""
+        local = self.local
+        if getattr(local, 'stage', None):
+            # Nested in a profiled call on this thread; already covered
+            return function(*args, **kwargs)
+        profile = getattr(local, 'profile', None)
+        if profile is None:
+            import cProfile
+
+            # Each thread gets its own profiler; they are merged when the run is saved
+            profile = local.profile = cProfile.Profile()
+            with self.lock:
+                self.profiles.append(profile)
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active cProfile per process; this call is only sampled
+            profile = None
+
+        ident = threading.get_ident()
+        local.stage = stage
+        self.active[ident] = stage
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.active.pop(ident, None)
+            local.stage = None
+            if profile:
+                profile.disable()
+
+    def wrap(self, stage, function):
+        """function, profiled as part of `stage` whenever it is called"""
+        def profiled(*args, **kwargs):
+            return self.run(stage, function, *args, **kwargs)
+        return profiled
+
+    def sample(self):
+        run_code = self.run.__code__
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, stage in self.active.copy().items():
+                frame = frames.get(ident)
+                stack = []
+                # Walk up to the profiled call; the frames above it are the same on every sample
+                while frame is not None and frame.f_code is not run_code:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stack.append(stage)
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def stats(self):
+        """The merged pstats.Stats of every thread, or None if nothing was profiled"""
+        import pstats
+
+        merged = None
+        with self.lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if merged is None:
+                merged = pstats.Stats(profile)
+            else:
+                merged.add(profile)
+        return merged
+
+    def top(self, limit=10):
+        """(function, own seconds, calls) for the functions with the most time spent in their own code"""
+        merged = self.stats()
+        if merged is None:
+            return []
+        rows = sorted(merged.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        return [(f"{name} ({os.path.basename(path)}:{line})", own, calls)
+                for (path, line, name), (_, calls, own, _, _) in rows]
+
+    def stop(self):
+        """Stop the sampler thread (save() does this too)"""
+        self.stopped.set()
+        self.sampler.join()
+
+    def save(self):
+        """Stop sampling and write the profile files; returns (pstats_file, collapsed_file)"""
+        self.stop()
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        pstats_file = os.path.join(self.output_dir, f'profile_{self.timestamp}.pstats')
+        merged = self.stats()
+        if merged is not None:
+            merged.dump_stats(pstats_file)
+        else:
+            pstats_file = None
+
+        collapsed_file = os.path.join(self.output_dir, f'profile_{self.timestamp}.collapsed')
+        with open(collapsed_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return pstats_file, collapsed_file
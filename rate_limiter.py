@@ -0,0 +1,40 @@
+"""
+Global request rate limit for traffic to the IRD portal
+Shared by every session of a pool; the rate can be changed while a batch runs
+"""
+
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate=0):
+        # Requests per second across all sessions; 0 means unlimited
+        self.rate = rate
+        self.next_slot = 0
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            # Forget slots booked under the old rate
+            self.next_slot = min(self.next_slot, time.time())
+
+    def reserve(self):
+        """Book the next request slot; returns the seconds until it comes up (async callers sleep themselves)"""
+        with self.lock:
+            if not self.rate:
+                return 0
+            now = time.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 1 / self.rate
+        return slot - now
+
+    def wait(self):
+        """Block until the next request slot; slots are handed out in order of arrival"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def describe(self):
+        return f"{self.rate:g} req/s" if self.rate else "unlimited"
@@ -0,0 +1,211 @@
+"""
+Local indexed store of scraped PAN records
+Every successful lookup is upserted into a SQLite database with a full-text
+index on the name and ordinary indexes on office, city and registration
+type/status, so records can be searched without opening the Excel outputs
+"""
+
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    pan TEXT PRIMARY KEY,
+    status TEXT,
+    office TEXT COLLATE NOCASE,
+    name TEXT,
+    telephone TEXT,
+    ward TEXT,
+    street TEXT,
+    city TEXT COLLATE NOCASE,
+    fiscal_year TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS records_office ON records (office);
+CREATE INDEX IF NOT EXISTS records_city ON records (city);
+CREATE TABLE IF NOT EXISTS registrations (
+    pan TEXT NOT NULL,
+    type TEXT COLLATE NOCASE,
+    reg_date TEXT,
+    status TEXT COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS registrations_pan ON registrations (pan, type, status);
+CREATE INDEX IF NOT EXISTS registrations_type_status ON registrations (type, status);
+"""
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(name, tokenize='unicode61 remove_diacritics 2')"
+
+# Record columns and the pan_details keys they hold (as written to the PAN sheet)
+RECORD_FIELDS = [
+    ('pan', 'PAN No'),
+    ('status', 'Status'),
+    ('office', 'Office'),
+    ('name', 'Name'),
+    ('telephone', 'Telephone'),
+    ('ward', 'Ward'),
+    ('street', 'Street Name'),
+    ('city', 'City Name'),
+    ('fiscal_year', 'Fiscal Year/Return Verified Date'),
+]
+REGISTRATION_FIELDS = [('type', 'Type'), ('reg_date', 'Reg. Date'), ('status', 'Status')]
+
+# Writes are committed in groups; close() commits the rest
+COMMIT_EVERY = 200
+COMMIT_INTERVAL = 2
+
+
+class RecordStore:
+    def __init__(self, path='pan_records.db'):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # Readers (pan_query.py) are not blocked by a batch writing
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        try:
+            self.conn.execute(FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: name searches fall back to a table scan
+            self.full_text = False
+        self.conn.commit()
+        self.uncommitted = 0
+        self.last_commit = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, pan_details, registration_details=()):
+        """Insert or replace one PAN's record and registrations"""
+        with self.lock:
+            self.write_record(pan_details, registration_details, time.time())
+            self.uncommitted += 1
+            if self.uncommitted >= COMMIT_EVERY or time.time() - self.last_commit >= COMMIT_INTERVAL:
+                self.commit_locked()
+
+    def add_many(self, records, updated):
+        """Write (pan_details, registration_details) pairs as of `updated` in one transaction,
+        skipping PANs the store already has a newer record for; returns the number written"""
+        written = 0
+        with self.lock:
+            for pan_details, registration_details in records:
+                row = self.conn.execute("SELECT updated FROM records WHERE pan = ?",
+                                        (str(pan_details.get('PAN No', '')),)).fetchone()
+                if row and row['updated'] >= updated:
+                    continue
+                self.write_record(pan_details, registration_details, updated)
+                written += 1
+            self.commit_locked()
+        return written
+
+    def write_record(self, pan_details, registration_details, updated):
+        values = [pan_details.get(key, '') for _, key in RECORD_FIELDS]
+        pan = str(values[0])
+        conn = self.conn
+        conn.execute(
+            f"INSERT INTO records ({', '.join(column for column, _ in RECORD_FIELDS)}, updated) "
+            f"VALUES ({', '.join('?' * len(RECORD_FIELDS))}, ?) "
+            f"ON CONFLICT (pan) DO UPDATE SET "
+            f"{', '.join(f'{column} = excluded.{column}' for column, _ in RECORD_FIELDS[1:])}, updated = excluded.updated",
+            values + [updated])
+        if self.full_text:
+            rowid = conn.execute("SELECT rowid FROM records WHERE pan = ?", (pan,)).fetchone()[0]
+            conn.execute("DELETE FROM records_fts WHERE rowid = ?", (rowid,))
+            conn.execute("INSERT INTO records_fts (rowid, name) VALUES (?, ?)", (rowid, values[3]))
+        conn.execute("DELETE FROM registrations WHERE pan = ?", (pan,))
+        conn.executemany("INSERT INTO registrations (pan, type, reg_date, status) VALUES (?, ?, ?, ?)",
+                         [(pan, *(registration.get(key, '') for _, key in REGISTRATION_FIELDS))
+                          for registration in registration_details])
+
+    def add_result(self, result):
+        """Store a lookup result; only successful lookups carry a record"""
+        if result.get('success'):
+            self.add(result['pan_details'], result.get('registration_details', ()))
+
+    def commit_locked(self):
+        self.conn.commit()
+        self.uncommitted = 0
+        self.last_commit = time.time()
+
+    def commit(self):
+        with self.lock:
+            self.commit_locked()
+
+    def get(self, pan_number):
+        """One PAN's record with its registrations, or None"""
+        matches = self.search(pan=pan_number, limit=1)
+        return matches[0] if matches else None
+
+    def search(self, name=None, office=None, city=None, reg_type=None, reg_status=None, pan=None, limit=50):
+        """Records matching every given criterion
+
+        name is a full-text query (each word matches as a prefix); office, city,
+        registration type and status match exactly, ignoring case
+        """
+        clauses, params = [], []
+        if pan:
+            clauses.append("r.pan = ?")
+            params.append(str(pan).strip())
+        if name:
+            if self.full_text:
+                clauses.append("r.rowid IN (SELECT rowid FROM records_fts WHERE records_fts MATCH ?)")
+                params.append(full_text_query(name))
+            else:
+                for word in name.split():
+                    clauses.append("r.name LIKE ?")
+                    params.append(f"%{word}%")
+        if office:
+            clauses.append("r.office = ?")
+            params.append(office)
+        if city:
+            clauses.append("r.city = ?")
+            params.append(city)
+        if reg_type or reg_status:
+            condition = " AND ".join(f"g.{column} = ?" for column, value in (('type', reg_type), ('status', reg_status))
+                                     if value)
+            clauses.append(f"EXISTS (SELECT 1 FROM registrations g WHERE g.pan = r.pan AND {condition})")
+            params.extend(value for value in (reg_type, reg_status) if value)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            # No ORDER BY: sorting every match would cost more than the search itself on broad criteria
+            rows = self.conn.execute(f"SELECT r.* FROM records r {where} LIMIT ?",
+                                     params + [limit]).fetchall()
+            records = []
+            for row in rows:
+                registrations = self.conn.execute(
+                    "SELECT type, reg_date, status FROM registrations WHERE pan = ? ORDER BY rowid", (row['pan'],))
+                records.append({
+                    'pan_details': {key: row[column] for column, key in RECORD_FIELDS},
+                    'registration_details': [
+                        {'PAN No': row['pan'], **{key: registration[column] for column, key in REGISTRATION_FIELDS}}
+                        for registration in registrations
+                    ],
+                    'updated': row['updated'],
+                })
+        return records
+
+    def known_pans(self, pans):
+        """The subset of `pans` the store has a record for"""
+        pans = [str(pan).strip() for pan in pans]
+        known = set()
+        with self.lock:
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(pans), 500):
+                chunk = pans[start:start + 500]
+                known.update(row[0] for row in self.conn.execute(
+                    f"SELECT pan FROM records WHERE pan IN ({', '.join('?' * len(chunk))})", chunk))
+        return known
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def full_text_query(text):
+    """FTS5 query for free text: every word must match, as a prefix, in any order"""
+    words = [word.replace('"', '""') for word in text.split()]
+    return ' '.join(f'"{word}"*' for word in words)
@@ -0,0 +1,288 @@
+"""
+Record/replay of portal lookup responses
+Recording archives every lookup POST response (gzip JSONL, one line per PAN);
+replay pushes an archive through the parsing pipeline without touching the network
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from ajax_scraper import AjaxPANScraper, is_evaluated_payload
+from html_extractor import extract_html_records
+from excel_writer import ExcelResultWriter
+from structured_log import configure_logging
+
+
+class RecordedResponse:
+    """Just enough of requests.Response for the parsing functions"""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    @property
+    def content(self):
+        return self.text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseRecorder:
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        archive_dir = os.path.dirname(archive_path)
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+        self.file = gzip.open(archive_path, 'at', encoding='utf-8')
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def record(self, pan_number, method, url, kwargs, response):
+        """Buffer one response until the lookup for its PAN finishes"""
+        entry = {
+            'path': urlsplit(url).path,
+            'enc': 'json' if 'json' in kwargs else 'form',
+            'payload': kwargs.get('json') or kwargs.get('data'),
+            'status': response.status_code,
+            'body': response.text,
+        }
+        with self.lock:
+            self.pending.setdefault(pan_number, []).append(entry)
+
+    def flush(self, pan_number):
+        """Write the buffered responses of one lookup as a single archive line"""
+        with self.lock:
+            responses = self.pending.pop(pan_number, None)
+            if responses:
+                line = {'pan': pan_number, 'time': time.time(), 'responses': responses}
+                self.file.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def iter_archive(archive_path):
+    """Yield one recorded lookup per line"""
+    with gzip.open(archive_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_recorded_lookup(scraper, lookup):
+    """Run one recorded lookup through the same parsing ladder as a live search"""
+    pan_number = lookup['pan']
+    for entry in lookup['responses']:
+        if entry['status'] != 200:
+            continue
+
+        response = RecordedResponse(entry['status'], entry['body'])
+        if entry['path'] == urlsplit(scraper.search_url).path:
+            result = scraper.parse_discovered_response(response, pan_number)
+        elif entry['enc'] == 'json':
+            result = scraper.parse_lookup_response(response, pan_number, f"ajax-{entry['path']}")
+        else:
+            result = scraper.parse_lookup_response(response, pan_number, f"ajax-form-{entry['path']}",
+                                                   json_fallback=False)
+
+        # As in a live lookup, a guessed payload's no-record answer is not definitive
+        if result['success'] or (result.get('not_found') and is_evaluated_payload(entry.get('payload'))):
+            return result
+
+    return {'success': False}
+
+
+def replay_archive(archive_path, scraper=None):
+    """Yield (pan, result) for every lookup in an archive"""
+    scraper = scraper or AjaxPANScraper()
+    for lookup in iter_archive(archive_path):
+        yield lookup['pan'], parse_recorded_lookup(scraper, lookup)
+
+
+def quiet_parsers():
+    """Parsers log at INFO per record; keep replay at disk speed"""
+    logging.getLogger('ajax_scraper').setLevel(logging.WARNING)
+
+
+def run_parse(archive_path, output_dir=None):
+    """Re-parse an archive and optionally write the usual Excel outputs"""
+    quiet_parsers()
+    scraper = AjaxPANScraper()
+    writer = ExcelResultWriter(output_dir) if output_dir else None
+    found = not_found = failed = 0
+
+    for pan_number, result in replay_archive(archive_path, scraper):
+        if result['success']:
+            found += 1
+            if writer:
+                writer.add_result(result['pan_details'], result['registration_details'])
+        else:
+            if result.get('not_found'):
+                not_found += 1
+            else:
+                failed += 1
+            if writer:
+                writer.add_result(scraper.get_empty_pan_details(pan_number))
+
+    print(f"Replayed {found + not_found + failed} lookups: {found} found, {not_found} without record, {failed} failed")
+
+    if writer:
+        pan_file, reg_file = writer.close()
+        if pan_file:
+            print(f"📁 PAN details saved to: {pan_file}")
+        if reg_file:
+            print(f"📁 Registration details saved to: {reg_file}")
+
+
+def run_benchmark(archive_path, repeat=3):
+    """Measure parser throughput over an archive, best of several passes"""
+    quiet_parsers()
+    # Decompress and decode once so the timing covers parsing only
+    lookups = list(iter_archive(archive_path))
+    responses = sum(len(lookup['responses']) for lookup in lookups)
+    megabytes = sum(len(entry['body']) for lookup in lookups for entry in lookup['responses']) / 1e6
+    scraper = AjaxPANScraper()
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for lookup in lookups:
+            parse_recorded_lookup(scraper, lookup)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"Archive: {len(lookups)} lookups, {responses} responses, {megabytes:.1f} MB of bodies")
+    print(f"Best of {repeat}: {best:.2f}s = {len(lookups) / best:,.0f} PANs/sec, "
+          f"{responses / best:,.0f} responses/sec, {megabytes / best:.1f} MB/sec")
+    return best
+
+
+def run_parity(archive_path):
+    """Compare the single-pass HTML extractor with the BeautifulSoup reference on every HTML response"""
+    quiet_parsers()
+    scraper = AjaxPANScraper()
+    pages = [(lookup['pan'], entry['body'])
+             for lookup in iter_archive(archive_path)
+             for entry in lookup['responses']
+             if entry['status'] == 200 and lookup['pan'] in entry['body'] and not entry['body'].lstrip().startswith(('{', '['))]
+
+    start = time.perf_counter()
+    expected = [scraper.parse_html_with_soup(body, pan) for pan, body in pages]
+    soup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = []
+    for pan, body in pages:
+        pan_details = scraper.get_empty_pan_details(pan)
+        registration_details = []
+        extract_html_records(body, pan_details, registration_details, pan)
+        actual.append((pan_details, registration_details))
+    single_pass_time = time.perf_counter() - start
+
+    mismatches = [pan for (pan, _), want, got in zip(pages, expected, actual) if want != got]
+    print(f"HTML pages: {len(pages)}, mismatches: {len(mismatches)}")
+    if pages:
+        print(f"BeautifulSoup: {soup_time:.2f}s, single pass: {single_pass_time:.2f}s "
+              f"({soup_time / max(single_pass_time, 1e-9):.1f}x faster)")
+    for pan in mismatches[:10]:
+        print(f"  mismatch for PAN {pan}")
+    return not mismatches
+
+
+def synthesize_archive(archive_path, pan_count, seed=1):
+    """Write an archive of realistic fake lookups (JSON, HTML fallback and no-record pages)"""
+    rng = random.Random(seed)
+    offices = ['IRO Kathmandu', 'IRO Lalitpur', 'Taxpayer Service Office Baneshwor', 'IRO Pokhara', 'IRO Biratnagar']
+    cities = ['Kathmandu', 'Lalitpur', 'Bhaktapur', 'Pokhara', 'Biratnagar']
+    no_record = json.dumps({'panDetails': [], 'panRegistrationDetail': [], 'panTaxClearance': []})
+
+    with gzip.open(archive_path, 'wt', encoding='utf-8') as f:
+        for n in range(pan_count):
+            pan = str(300000000 + n)
+            kind = rng.random()
+            registrations = [
+                {'acctType': rng.choice(['0', '10', '20', '30']), 'accountStatus': rng.choice('AIC'),
+                 'registrationDate': f"20{rng.randint(60, 80)}.{rng.randint(1, 12):02d}.{rng.randint(1, 30):02d}"}
+                for _ in range(rng.randint(1, 3))
+            ]
+            office, city = rng.choice(offices), rng.choice(cities)
+            # What the scraper posts: the form's field with a solved captcha and the page's token
+            payload = {'pan': pan, 'captcha': str(n % 17 + 2), '_token': f"token-{n}"}
+
+            if kind < 0.6:
+                body = json.dumps({
+                    'panDetails': [{'pan': pan, 'trade_Name_Eng': f"Trader {n} Pvt. Ltd.", 'office_Name': office,
+                                    'telephone': f"01-{rng.randint(4000000, 5999999)},", 'ward_No': str(rng.randint(1, 32)),
+                                    'street_Name': f"Street {rng.randint(1, 500)}", 'vdc_Town': city}],
+                    'panRegistrationDetail': registrations,
+                    'panTaxClearance': [{'fiscal_Year': '2080/081', 'return_Verified_Date': '2081.03.15'}],
+                })
+                responses = [{'path': '/panDetails', 'enc': 'json', 'payload': payload, 'status': 200, 'body': body}]
+            elif kind < 0.85:
+                rows = ''.join(f"<tr><td>{r['acctType']}</td><td>{r['registrationDate']}</td><td>{r['accountStatus']}</td></tr>"
+                               for r in registrations)
+                filler = '<div class="menu"><ul>' + '<li><a href="#">Link</a></li>' * 200 + '</ul></div>'
+                body = (f"<html><body>{filler}<h3>PAN Details</h3><table>"
+                        f"<tr><th>Office</th><td>{office}</td></tr><tr><th>PAN</th><td>{pan}</td></tr>"
+                        f"<tr><th>Name</th><td>Trader {n}</td></tr><tr><th>Telephone</th><td>01-4000000</td></tr>"
+                        f"<tr><th>Ward</th><td>4</td></tr><tr><th>Street Name</th><td>New Road</td></tr>"
+                        f"<tr><th>City Name</th><td>{city}</td></tr></table>"
+                        f"<h3>Registration Details</h3><table><tr><th>Type</th><th>Reg. Date</th><th>Status</th></tr>{rows}</table>"
+                        f"</body></html>")
+                if n % 2:
+                    # Indented markup, whose whitespace-only strings the parsers must collapse alike
+                    body = body.replace('<tr>', '\n\t<tr>\n\t\t').replace('</td>', '</td>\t').replace('</table>', '\n</table>')
+                responses = [
+                    {'path': '/panDetails', 'enc': 'json', 'payload': payload, 'status': 419, 'body': ''},
+                    {'path': '/panDetails', 'enc': 'form', 'payload': payload, 'status': 200, 'body': body},
+                ]
+            else:
+                responses = [{'path': '/panDetails', 'enc': 'json', 'payload': payload, 'status': 200, 'body': no_record}]
+
+            f.write(json.dumps({'pan': pan, 'time': time.time(), 'responses': responses}) + '\n')
+
+    print(f"Wrote {pan_count} synthetic lookups to {archive_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded portal responses through the parsers")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parse_cmd = subparsers.add_parser('parse', help="Re-parse an archive")
+    parse_cmd.add_argument('archive')
+    parse_cmd.add_argument('-o', '--output-dir', help="Write Excel outputs to this directory")
+
+    bench_cmd = subparsers.add_parser('bench', help="Measure parser throughput on an archive")
+    bench_cmd.add_argument('archive')
+    bench_cmd.add_argument('--repeat', type=int, default=3)
+
+    parity_cmd = subparsers.add_parser('parity', help="Check the single-pass HTML extractor against BeautifulSoup")
+    parity_cmd.add_argument('archive')
+
+    synth_cmd = subparsers.add_parser('synthesize', help="Create a synthetic archive for benchmarking")
+    synth_cmd.add_argument('archive')
+    synth_cmd.add_argument('--pans', type=int, default=10000)
+
+    args = parser.parse_args()
+    configure_logging()
+    if args.command == 'parse':
+        run_parse(args.archive, args.output_dir)
+    elif args.command == 'bench':
+        run_benchmark(args.archive, args.repeat)
+    elif args.command == 'parity':
+        sys.exit(0 if run_parity(args.archive) else 1)
+    else:
+        synthesize_archive(args.archive, args.pans)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Persistent result cache for PAN lookups
+Remembers found PANs and known-invalid PANs between runs, each with its own TTL
+"""
+
+import json
+import os
+import threading
+import time
+
+
+class ResultCache:
+    def __init__(self, cache_file="pan_cache.jsonl", ttl=7 * 24 * 3600, negative_ttl=24 * 3600):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Load cache entries from disk, newest line wins"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+
+        stale_lines = 0
+        with open(self.cache_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry['pan'] in self.entries:
+                        stale_lines += 1
+                    self.entries[entry['pan']] = entry
+                except (ValueError, KeyError):
+                    stale_lines += 1
+
+        # Drop expired entries and rewrite the file once it carries more dead lines than live ones
+        now = time.time()
+        expired = [pan for pan, entry in self.entries.items() if self.is_expired(entry, now)]
+        for pan in expired:
+            del self.entries[pan]
+        if stale_lines + len(expired) > len(self.entries):
+            self.compact()
+
+    def is_expired(self, entry, now=None):
+        """Check an entry against the TTL for its kind"""
+        ttl = self.ttl if entry.get('found') else self.negative_ttl
+        return ((now or time.time()) - entry.get('time', 0)) > ttl
+
+    def get(self, pan_number):
+        """Return the cached entry for a PAN, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(str(pan_number))
+            if entry is None:
+                return None
+            if self.is_expired(entry):
+                del self.entries[str(pan_number)]
+                return None
+            return entry
+
+    def get_result(self, pan_number):
+        """Return a cached search result in the same shape as search_pan_ajax"""
+        entry = self.get(pan_number)
+        if entry is None:
+            return None
+        if entry['found']:
+            result = dict(entry['result'])
+            result['cached'] = True
+            return result
+        return {'success': False, 'not_found': True, 'cached': True, 'reason': 'no_record',
+                'message': 'No record found for PAN (cached)'}
+
+    def put(self, pan_number, result):
+        """Cache a successful search result"""
+        self.write_entry({'pan': str(pan_number), 'found': True, 'time': time.time(), 'result': result})
+
+    def put_negative(self, pan_number):
+        """Remember a PAN the portal reported as nonexistent"""
+        self.write_entry({'pan': str(pan_number), 'found': False, 'time': time.time()})
+
+    def put_many(self, entries):
+        """Cache several (pan, result, time) successful results with one file write; expired ones, and
+        ones older than what is cached, are skipped. Returns the number cached"""
+        entries = [{'pan': str(pan), 'found': True, 'time': found_time, 'result': result}
+                   for pan, result, found_time in entries]
+        entries = [entry for entry in entries if not self.is_expired(entry)]
+        with self.lock:
+            # Never replace a newer entry (e.g. from a live run) with an older one
+            entries = [entry for entry in entries if self.entries.get(entry['pan'], {}).get('time', 0) < entry['time']]
+            for entry in entries:
+                self.entries[entry['pan']] = entry
+            if self.cache_file and entries:
+                cache_dir = os.path.dirname(self.cache_file)
+                if cache_dir:
+                    os.makedirs(cache_dir, exist_ok=True)
+                with open(self.cache_file, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+        return len(entries)
+
+    def write_entry(self, entry):
+        with self.lock:
+            self.entries[entry['pan']] = entry
+            if self.cache_file:
+                cache_dir = os.path.dirname(self.cache_file)
+                if cache_dir:
+                    os.makedirs(cache_dir, exist_ok=True)
+                with open(self.cache_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def compact(self):
+        """Rewrite the cache file with only live entries"""
+        if not self.cache_file:
+            return
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_file, self.cache_file)
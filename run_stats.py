@@ -0,0 +1,63 @@
+"""
+Live statistics for a batch run
+Counters are updated by the worker as each PAN finishes and read by the
+GUI a few times per second; every read is a consistent snapshot
+"""
+
+import threading
+import time
+from collections import Counter
+
+
+class RunStats:
+    def __init__(self, total=0):
+        self.total = total
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.done = 0
+        self.successful = 0
+        self.not_found = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.requeued = 0
+        # Which lookup path produced the data: an ajax_endpoints name, 'discovered_method' or 'bulk_stats'
+        self.endpoints = Counter()
+
+    def record(self, result):
+        """Count one finished PAN"""
+        with self.lock:
+            self.done += 1
+            if result.get('cached'):
+                self.cache_hits += 1
+            if result.get('success'):
+                self.successful += 1
+                if not result.get('cached'):
+                    self.endpoints[result.get('endpoint') or result.get('source', 'unknown')] += 1
+            elif result.get('not_found'):
+                self.not_found += 1
+            else:
+                self.failed += 1
+
+    def record_requeue(self):
+        with self.lock:
+            self.requeued += 1
+
+    def snapshot(self, requests_sent=0):
+        """Rates and counts as of now"""
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            done = self.done
+            return {
+                'done': done,
+                'total': self.total,
+                'elapsed': elapsed,
+                'pans_per_sec': done / elapsed,
+                'requests_per_pan': requests_sent / done if done else 0.0,
+                'success_rate': self.successful / done * 100 if done else 0.0,
+                'cache_hit_rate': self.cache_hits / done * 100 if done else 0.0,
+                'successful': self.successful,
+                'not_found': self.not_found,
+                'failed': self.failed,
+                'requeued': self.requeued,
+                'endpoints': self.endpoints.most_common(),
+            }
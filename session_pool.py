@@ -0,0 +1,321 @@
+"""
+Pool of independent scraper sessions
+Each session keeps its own cookies, CSRF token, User-Agent and rate budget;
+PANs are spread across them and throttled sessions are replaced in the background
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+from ajax_scraper import AjaxPANScraper, DEFAULT_BASE_URL, is_transient_failure
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from rate_limiter import RateLimiter
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0',
+]
+
+# Second pass over transiently failed PANs: rounds, and the pause before the first (doubled for each later round)
+SECOND_PASS_ROUNDS = 2
+SECOND_PASS_BACKOFF = 10
+
+
+class PooledSession:
+    """One identity in the pool: a scraper with its own session plus its rate budget"""
+
+    def __init__(self, session_id, scraper, min_interval):
+        self.session_id = session_id
+        self.scraper = scraper
+        self.min_interval = min_interval
+        self.next_allowed = 0
+        self.busy = False
+        self.lookups = 0
+
+    def describe(self):
+        egress = getattr(self.scraper, 'egress', None)
+        route = f" via {egress.url or 'direct'}" if egress else ""
+        return f"session {self.session_id}{route} ({self.lookups} lookups)"
+
+
+class SessionPool:
+    def __init__(self, size=1, min_interval=3, cache=None, breaker=None, scraper_factory=None, recorder=None,
+                 canonicalize=False, rate_limiter=None, egress_pool=None, base_url=DEFAULT_BASE_URL,
+                 pipeline=False, hedging=None, profiler=None):
+        self.size = size
+        self.min_interval = min_interval
+        self.cache = cache
+        self.recorder = recorder
+        self.canonicalize = canonicalize
+        self.base_url = base_url
+        # Prefetch each session's next token and captcha while its current lookup runs
+        self.pipeline = pipeline
+        # Optional HedgePolicy; latencies and the hedge budget are shared by all sessions
+        self.hedging = hedging
+        # Optional RunProfiler handed to every session
+        self.profiler = profiler
+        # All sessions talk to the same portal, so they share one circuit breaker
+        self.breaker = breaker or CircuitBreaker()
+        # ... and one request rate budget across all sessions
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # Optional EgressPool; new sessions go out through the least loaded healthy proxy
+        self.egress_pool = egress_pool
+        self.scraper_factory = scraper_factory or self.create_scraper
+        self.logger = logging.getLogger(__name__)
+
+        self.ids = itertools.count(1)
+        self.sessions = []
+        self.warming = 0
+        self.retired = 0
+        self.retired_requests = 0
+        # What the statistics endpoint is known to accept, handed to every session (see search_pans_bulk)
+        self.bulk_payload = None
+        self.closed = False
+        # Stands in for the sessions while there are none (all retired, replacements warming); closed with the pool
+        self.probe = None
+        self.condition = threading.Condition()
+
+        for _ in range(size):
+            self.sessions.append(self.new_session())
+
+    def create_scraper(self, user_agent):
+        return AjaxPANScraper(cache=self.cache, breaker=self.breaker, user_agent=user_agent,
+                              recorder=self.recorder, canonicalize=self.canonicalize,
+                              rate_limiter=self.rate_limiter, egress_pool=self.egress_pool, base_url=self.base_url,
+                              pipeline=self.pipeline, hedging=self.hedging, profiler=self.profiler)
+
+    def new_session(self):
+        session_id = next(self.ids)
+        user_agent = USER_AGENTS[(session_id - 1) % len(USER_AGENTS)]
+        scraper = self.scraper_factory(user_agent)
+        scraper.bulk_payload = self.bulk_payload
+        return PooledSession(session_id, scraper, self.min_interval)
+
+    @property
+    def scraper(self):
+        """A scraper from the pool, for logging and portal probes"""
+        with self.condition:
+            if self.sessions:
+                return self.sessions[0].scraper
+            if self.probe is None:
+                self.probe = self.scraper_factory(USER_AGENTS[0])
+            return self.probe
+
+    def acquire(self):
+        """Wait for an idle session whose rate budget allows another lookup"""
+        with self.condition:
+            while True:
+                idle = [s for s in self.sessions if not s.busy]
+                if idle:
+                    pooled = min(idle, key=lambda s: s.next_allowed)
+                    wait = pooled.next_allowed - time.time()
+                    if wait <= 0:
+                        pooled.busy = True
+                        return pooled
+                    self.condition.wait(wait)
+                else:
+                    self.condition.wait()
+
+    def release(self, pooled, result):
+        """Return a session to the pool, retiring it if the portal throttled it"""
+        throttled = pooled.scraper.throttled > 0
+        with self.condition:
+            pooled.busy = False
+            if not result.get('cached'):
+                pooled.lookups += 1
+                pooled.next_allowed = time.time() + pooled.min_interval
+            if throttled and pooled in self.sessions:
+                self.sessions.remove(pooled)
+                self.retired += 1
+                self.retired_requests += pooled.scraper.requests_sent
+                pooled.scraper.close()
+                self.logger.warning("Retiring throttled %s", pooled.describe())
+                if len(self.sessions) + self.warming < self.size:
+                    self.start_replacement()
+            elif pooled in self.sessions and len(self.sessions) > self.size:
+                # The pool was shrunk while this session was busy
+                self.drop_session(pooled)
+            self.condition.notify_all()
+
+        if throttled and not result['success']:
+            # The miss came from throttling, not from the PAN
+            result['retry'] = True
+            result['reason'] = 'throttled'
+            result.setdefault('message', 'Session throttled by portal')
+
+    def warm_up(self):
+        """Open every session's connections in parallel before the batch starts"""
+        with self.condition:
+            scrapers = [pooled.scraper for pooled in self.sessions]
+        threads = [threading.Thread(target=scraper.warm_up, daemon=True) for scraper in scrapers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def renew_sessions(self):
+        """Replace every idle session with a fresh one: new cookies, token and connections"""
+        with self.condition:
+            for index, pooled in enumerate(self.sessions):
+                if not pooled.busy:
+                    self.retired_requests += pooled.scraper.requests_sent
+                    pooled.scraper.close()
+                    self.sessions[index] = self.new_session()
+            self.condition.notify_all()
+        self.warm_up()
+
+    def retry_transient(self, failures, rounds=SECOND_PASS_ROUNDS, backoff=SECOND_PASS_BACKOFF,
+                        should_continue=None, on_round=None, on_wait=None):
+        """Second pass over PANs whose lookups failed for a transient reason (see TRANSIENT_REASONS)
+
+        Each round pauses (backoff seconds, doubling every round), renews all sessions and
+        looks up again the PANs still failing transiently. `failures` maps PAN -> first-pass
+        result; the final result of every one of them is returned the same way
+        """
+        results = dict(failures)
+        for round_number in range(rounds):
+            pending = [pan for pan, result in results.items() if is_transient_failure(result)]
+            if not pending:
+                break
+            delay = backoff * 2 ** round_number
+            if on_round:
+                on_round(round_number + 1, pending, delay)
+            deadline = time.time() + delay
+            while time.time() < deadline:
+                if should_continue and not should_continue():
+                    return results
+                time.sleep(min(0.5, max(0, deadline - time.time())))
+            self.renew_sessions()
+
+            for pan in pending:
+                if should_continue and not should_continue():
+                    return results
+                if self.breaker.state != CircuitBreaker.CLOSED:
+                    self.wait_for_portal(should_continue=should_continue, on_wait=on_wait)
+                results[pan] = self.search(pan)
+        return results
+
+    def resize(self, size):
+        """Change the number of sessions; extra sessions leave as soon as they are idle"""
+        with self.condition:
+            self.size = size
+            while len(self.sessions) + self.warming < size:
+                self.sessions.append(self.new_session())
+            for pooled in [s for s in self.sessions if not s.busy][:max(0, len(self.sessions) - size)]:
+                self.drop_session(pooled)
+            self.condition.notify_all()
+
+    def drop_session(self, pooled):
+        self.sessions.remove(pooled)
+        self.retired_requests += pooled.scraper.requests_sent
+        pooled.scraper.close()
+        self.logger.info("Closed %s", pooled.describe())
+
+    def set_min_interval(self, min_interval):
+        """Change the delay between lookups on one session, for current and future sessions"""
+        with self.condition:
+            self.min_interval = min_interval
+            for pooled in self.sessions:
+                pooled.next_allowed += min_interval - pooled.min_interval
+                pooled.min_interval = min_interval
+            self.condition.notify_all()
+
+    def start_replacement(self):
+        self.warming += 1
+        thread = threading.Thread(target=self.warm_replacement, daemon=True)
+        thread.start()
+
+    def warm_replacement(self):
+        """Build a fresh session and fetch the search page once before it takes PANs"""
+        pooled = self.new_session()
+        while not self.closed:
+            try:
+                if pooled.scraper.get_csrf_token():
+                    break
+            except CircuitOpenError:
+                pass
+            time.sleep(self.min_interval)
+        pooled.scraper.throttled = 0
+
+        with self.condition:
+            self.warming -= 1
+            if not self.closed and len(self.sessions) < self.size:
+                # Give the portal a full interval before the new session's first lookup
+                pooled.min_interval = self.min_interval
+                pooled.next_allowed = time.time() + pooled.min_interval
+                self.sessions.append(pooled)
+                self.logger.info("Warmed replacement %s", pooled.describe())
+            else:
+                self.retired_requests += pooled.scraper.requests_sent
+                pooled.scraper.close()
+            self.condition.notify_all()
+
+    def search(self, pan_number):
+        """Look up one PAN on the next available session"""
+        pooled = self.acquire()
+        result = {'success': False}
+        try:
+            result = pooled.scraper.search_pan_ajax(pan_number)
+            return result
+        finally:
+            self.release(pooled, result)
+
+    def search_bulk(self, pan_numbers, batch_size):
+        """Answer what the statistics endpoint can with multi-PAN requests; returns {pan: result}"""
+        results = {}
+        todo = [pan for pan in pan_numbers if not (self.cache and self.cache.get(pan))]
+        
+        for start in range(0, len(todo), batch_size):
+            chunk = todo[start:start + batch_size]
+            pooled = self.acquire()
+            answered = {}
+            try:
+                answered = pooled.scraper.search_pans_bulk(chunk)
+            finally:
+                self.release(pooled, {'success': bool(answered)})
+            
+            # Share what this session learned about the endpoint with the rest of the pool
+            with self.condition:
+                self.bulk_payload = pooled.scraper.bulk_payload
+                for other in self.sessions:
+                    other.scraper.bulk_payload = self.bulk_payload
+            if self.bulk_payload is False:
+                break
+            results.update(answered)
+        
+        return results
+
+    @property
+    def requests_sent(self):
+        with self.condition:
+            return self.retired_requests + sum(s.scraper.requests_sent for s in self.sessions)
+
+    def wait_for_portal(self, should_continue=None, on_wait=None):
+        return self.scraper.wait_for_portal(should_continue=should_continue, on_wait=on_wait)
+
+    def describe(self):
+        with self.condition:
+            active = len(self.sessions)
+        text = f"{active} sessions"
+        if self.warming:
+            text += f", {self.warming} warming"
+        if self.retired:
+            text += f", {self.retired} retired"
+        if self.egress_pool:
+            text += f", {self.egress_pool.describe()}"
+        return f"{text}, {self.breaker.describe()}"
+
+    def close(self):
+        """Stop warming replacements and release every session's connections"""
+        with self.condition:
+            self.closed = True
+            for pooled in self.sessions:
+                pooled.scraper.close()
+            if self.probe:
+                self.probe.close()
+            self.condition.notify_all()
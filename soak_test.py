@@ -0,0 +1,259 @@
+"""
+Soak test for long batch runs
+Drives search_multiple_pans (or the GUI processing path) against a local mock
+portal, samples RSS, open file descriptors, thread count and per-PAN latency
+over time, and fails if resource usage trends upward
+"""
+
+import argparse
+import contextlib
+import csv
+import glob
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from mock_portal import MockPortal
+from result_cache import ResultCache
+from structured_log import configure_logging, lookup_logger
+
+# Growth between the first and last third of the run (after warm-up) that fails the test:
+# (metric, absolute tolerance, tolerance relative to the starting level)
+TREND_LIMITS = [
+    ('rss_mb', 20, 0.10),
+    ('fds', 5, 0),
+    ('threads', 5, 0),
+    ('latency_ms', 20, 0.50),
+]
+FIRST_PAN = 300000000
+
+
+def resident_memory_mb():
+    """Current RSS; falls back to the peak where /proc is not available"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def open_fds():
+    for fd_dir in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            continue
+    return 0
+
+
+class LatencyCollector(logging.Handler):
+    """Collects per-PAN lookup times from the structured lookup log"""
+
+    def __init__(self):
+        super().__init__()
+        self.latencies = []
+        self.guard = threading.Lock()
+
+    def emit(self, record):
+        line = json.loads(record.getMessage())
+        with self.guard:
+            self.latencies.append(line['ms'])
+
+    def drain(self):
+        with self.guard:
+            latencies, self.latencies = self.latencies, []
+            return latencies
+
+
+class ResourceSampler(threading.Thread):
+    def __init__(self, collector, interval):
+        super().__init__(name='soak-sampler', daemon=True)
+        self.collector = collector
+        self.interval = interval
+        self.samples = []
+        self.started = time.time()
+        self.stopped = threading.Event()
+        # Batches run with stdout redirected; the sample table goes to the real one
+        self.out = sys.stdout
+
+    def take_sample(self):
+        latencies = self.collector.drain()
+        sample = {
+            'elapsed': round(time.time() - self.started, 1),
+            'pans': len(latencies),
+            'rss_mb': round(resident_memory_mb(), 1),
+            'fds': open_fds(),
+            'threads': threading.active_count(),
+            'latency_ms': round(statistics.median(latencies), 1) if latencies else None,
+        }
+        self.samples.append(sample)
+        print(f"{sample['elapsed']:>9.0f}s {sample['pans']:>9} {sample['rss_mb']:>9.1f} {sample['fds']:>6} "
+              f"{sample['threads']:>8} {sample['latency_ms'] if sample['latency_ms'] is not None else '-':>11}",
+              file=self.out, flush=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.take_sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.take_sample()
+
+
+def portfolio_batches(portfolio, batch_size):
+    """Endless batches cycling over a fixed portfolio, like repeated scheduled runs"""
+    position = 0
+    while True:
+        yield [str(FIRST_PAN + (position + i) % portfolio) for i in range(batch_size)]
+        position = (position + batch_size) % portfolio
+
+
+def soak_cache():
+    # In-memory and always expired: every lookup reaches the portal and the cache holds at most one portfolio
+    return ResultCache(cache_file=None, ttl=0, negative_ttl=0)
+
+
+def run_cli_batches(portal, deadline, args):
+    from pan_search import search_multiple_pans
+
+    with open(os.devnull, 'w') as devnull:
+        for pans in portfolio_batches(args.portfolio, args.batch):
+            if time.time() >= deadline:
+                return
+            with contextlib.redirect_stdout(devnull):
+                search_multiple_pans(pans, save_to_excel=True, sessions=args.sessions, delay=0, cache=soak_cache(),
+                                     base_url=portal.url, collect_results=False, pipeline=not args.no_pipeline)
+            for path in glob.glob('*.xlsx'):
+                os.remove(path)
+
+
+def run_gui_batches(portal, deadline, args):
+    """The PANScraperGUI processing path on a hidden window; needs a display"""
+    import tkinter as tk
+    from tkinter import messagebox
+    from gui_scraper import PANScraperGUI
+
+    # Completion dialogs are modal; answer them automatically
+    for name in ('showinfo', 'showwarning', 'showerror'):
+        setattr(messagebox, name, lambda *a, **k: None)
+
+    root = tk.Tk()
+    root.withdraw()
+    app = PANScraperGUI(root)
+    app.base_url = portal.url
+    app.delay_var.set('0')
+    app.sessions_var.set(str(args.sessions))
+    app.output_dir.set('.')
+
+    for pans in portfolio_batches(args.portfolio, args.batch):
+        if time.time() >= deadline:
+            break
+        app.cache = soak_cache()
+        app.pan_text.delete('1.0', tk.END)
+        app.pan_text.insert('1.0', '\n'.join(pans))
+        app.start_processing()
+        while app.processing:
+            root.update()
+            time.sleep(0.01)
+        for path in glob.glob('*.xlsx'):
+            os.remove(path)
+    root.destroy()
+
+
+def find_trends(samples, warmup):
+    """Metrics whose level in the last third of the run exceeds the first third by more than the limits"""
+    body = samples[int(len(samples) * warmup):]
+    third = len(body) // 3
+    if third < 2:
+        return None
+
+    failures = []
+    for metric, absolute, relative in TREND_LIMITS:
+        first = [s[metric] for s in body[:third] if s[metric] is not None]
+        last = [s[metric] for s in body[-third:] if s[metric] is not None]
+        if not first or not last:
+            continue
+        start, end = statistics.median(first), statistics.median(last)
+        if end - start > max(absolute, relative * start):
+            failures.append(f"{metric} grew from {start:g} to {end:g}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test batch processing against a local mock portal")
+    parser.add_argument('--mode', choices=['cli', 'gui'], default='cli',
+                        help="Drive search_multiple_pans or the GUI processing path (needs a display)")
+    parser.add_argument('--duration', type=float, default=10, help="Minutes to run")
+    parser.add_argument('--sample-every', type=float, default=10, help="Seconds between samples")
+    parser.add_argument('--batch', type=int, default=500, help="PANs per batch run")
+    parser.add_argument('--portfolio', type=int, default=5000, help="Distinct PANs cycled through")
+    parser.add_argument('--sessions', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=5, help="Mock portal response time")
+    parser.add_argument('--error-rate', type=float, default=0, help="Share of mock portal responses that are 503")
+    parser.add_argument('--cookie-churn', action='store_true', help="Mock portal sets a new cookie name per response")
+    parser.add_argument('--no-pipeline', action='store_true', help="Disable ticket prefetching (cli mode)")
+    parser.add_argument('--warmup', type=float, default=0.2, help="Share of samples ignored for trend detection")
+    parser.add_argument('--csv', help="Write the samples to this CSV file")
+    args = parser.parse_args()
+
+    configure_logging(logging.WARNING)
+    collector = LatencyCollector()
+    lookup_logger.addHandler(collector)
+    lookup_logger.setLevel(logging.INFO)
+
+    portal = MockPortal(latency=args.latency_ms / 1000, error_rate=args.error_rate,
+                        cookie_churn=args.cookie_churn).start()
+    workdir = tempfile.mkdtemp(prefix='pan_soak_')
+    csv_path = os.path.abspath(args.csv) if args.csv else None
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+
+    print(f"Soak test ({args.mode}) for {args.duration:g} minutes against {portal.url}")
+    print(f"{'elapsed':>10} {'PANs':>9} {'RSS (MB)':>9} {'fds':>6} {'threads':>8} {'p50 ms/PAN':>11}")
+    sampler = ResourceSampler(collector, args.sample_every)
+    sampler.take_sample()
+    sampler.start()
+    try:
+        deadline = time.time() + args.duration * 60
+        if args.mode == 'gui':
+            run_gui_batches(portal, deadline, args)
+        else:
+            run_cli_batches(portal, deadline, args)
+    finally:
+        sampler.stop()
+        portal.stop()
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if csv_path:
+        with open(csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(sampler.samples[0]))
+            writer.writeheader()
+            writer.writerows(sampler.samples)
+
+    total = sum(s['pans'] for s in sampler.samples)
+    print(f"\n{total} PANs, {portal.requests} portal requests")
+    failures = find_trends(sampler.samples, args.warmup)
+    if failures is None:
+        print("Too few samples for trend detection; run longer or sample more often")
+        sys.exit(2)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK: no upward trend in memory, file descriptors, threads or latency")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
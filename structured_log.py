@@ -0,0 +1,105 @@
+"""
+Logging setup for high-throughput runs
+Entry points configure logging once; per-attempt scraper logs are DEBUG,
+repetitive warnings are sampled, and an optional lookup log gets one compact
+JSON line per PAN with its outcome and timings
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# One JSON line per PAN; off (and free) until enable_lookup_log() attaches a destination
+lookup_logger = logging.getLogger('pan_lookup')
+lookup_logger.propagate = False
+lookup_logger.setLevel(logging.WARNING)
+
+
+def configure_logging(level=logging.INFO, lookup_log=None):
+    """Process-wide logging setup, called by entry points only"""
+    logging.basicConfig(level=level, format=LOG_FORMAT)
+    if lookup_log:
+        enable_lookup_log(lookup_log)
+
+
+def enable_lookup_log(target):
+    """Send per-PAN JSON lines to a file, or to stderr for '-'"""
+    handler = logging.StreamHandler(sys.stderr) if target == '-' else logging.FileHandler(target, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    lookup_logger.addHandler(handler)
+    lookup_logger.setLevel(logging.INFO)
+
+
+class LogSampler:
+    """Lets the first occurrence of an event through, then one in every `every`"""
+
+    MAX_KEYS = 1024
+
+    def __init__(self, every=100):
+        self.every = every
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        """Number of occurrences suppressed since the last one logged, or None to suppress this one"""
+        with self.lock:
+            if len(self.counts) >= self.MAX_KEYS and key not in self.counts:
+                self.counts.clear()
+            seen = self.counts[key]
+            self.counts[key] = seen + 1
+        if seen % self.every:
+            return None
+        return min(seen, self.every - 1)
+
+
+log_sampler = LogSampler()
+
+
+class LookupTrace:
+    """Phase timings of one lookup, emitted as a single JSON line when the lookup log is on"""
+
+    def __init__(self, pan_number, requests_sent=0):
+        self.pan_number = pan_number
+        self.requests_sent = requests_sent
+        self.started = self.mark = time.perf_counter()
+        self.phases = {}
+
+    def phase(self, name):
+        """Close the phase running since the previous mark"""
+        now = time.perf_counter()
+        self.phases[name] = round((now - self.mark) * 1000, 1)
+        self.mark = now
+
+    def emit(self, result, requests_sent=0):
+        if not lookup_logger.isEnabledFor(logging.INFO):
+            return
+        if result.get('cached'):
+            outcome = 'cached'
+        elif result.get('success'):
+            outcome = 'found'
+        elif result.get('not_found'):
+            outcome = 'not_found'
+        elif result.get('retry'):
+            outcome = 'retry'
+        else:
+            outcome = 'failed'
+
+        line = {
+            'time': round(time.time(), 3),
+            'pan': self.pan_number,
+            'outcome': outcome,
+            'endpoint': result.get('endpoint'),
+            'requests': requests_sent - self.requests_sent,
+            'ms': round((time.perf_counter() - self.started) * 1000, 1),
+            'phases': self.phases,
+        }
+        if outcome in ('not_found', 'retry', 'failed') and result.get('reason'):
+            line['reason'] = result['reason']
+        if outcome in ('retry', 'failed') and result.get('message'):
+            line['message'] = result['message']
+        lookup_logger.info(json.dumps(line, separators=(',', ':'), ensure_ascii=False))
@@ -0,0 +1,120 @@
+"""
+Recurring sweeps of a PAN portfolio
+A compact snapshot keeps the last known state of every PAN between runs; each
+sweep writes only the records that are new, changed or gone as a JSONL delta
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+NEW = 'new'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+
+def record_digest(pan_details, registration_details):
+    """Stable fingerprint of one PAN's record; registration order on the portal is not significant"""
+    registrations = sorted(json.dumps(reg, sort_keys=True, ensure_ascii=False) for reg in registration_details)
+    payload = json.dumps([pan_details, registrations], sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class SweepSnapshot:
+    """Last known record per PAN, stored as gzip JSONL"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[entry['pan']] = entry
+
+    def save(self):
+        """Write the snapshot atomically, so an interrupted sweep leaves the previous one intact"""
+        snapshot_dir = os.path.dirname(self.path)
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+class Sweep:
+    """One pass over the portfolio: compares each result with the snapshot and streams the delta"""
+
+    def __init__(self, snapshot_path, output_dir='.', timestamp=None):
+        self.snapshot = SweepSnapshot(snapshot_path)
+        timestamp = timestamp or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.delta_file = os.path.join(output_dir, f'pan_delta_{timestamp}.jsonl')
+        self.output_dir = output_dir
+        self.file = None
+        self.counts = {NEW: 0, CHANGED: 0, REMOVED: 0, 'unchanged': 0, 'unknown': 0}
+
+    def observe(self, pan_number, result):
+        """Compare one lookup result with the snapshot; returns the change written, if any"""
+        pan_number = str(pan_number)
+        previous = self.snapshot.entries.get(pan_number)
+
+        if result['success']:
+            pan_details = result['pan_details']
+            registration_details = result['registration_details']
+            digest = record_digest(pan_details, registration_details)
+            if previous and previous['digest'] == digest:
+                self.counts['unchanged'] += 1
+                return None
+            self.snapshot.entries[pan_number] = {
+                'pan': pan_number, 'digest': digest, 'time': time.time(),
+                'pan_details': pan_details, 'registration_details': registration_details,
+            }
+            change = {'change': CHANGED if previous else NEW, 'pan': pan_number,
+                      'pan_details': pan_details, 'registration_details': registration_details}
+            if previous:
+                change['fields'] = [field for field, value in pan_details.items()
+                                    if previous['pan_details'].get(field) != value]
+                if record_digest({}, previous['registration_details']) != record_digest({}, registration_details):
+                    change['fields'].append('registration_details')
+        elif result.get('not_found'):
+            if not previous:
+                self.counts['unchanged'] += 1
+                return None
+            del self.snapshot.entries[pan_number]
+            change = {'change': REMOVED, 'pan': pan_number,
+                      'pan_details': previous['pan_details'], 'registration_details': previous['registration_details']}
+        else:
+            # A failed lookup says nothing about the record; keep the last known state
+            self.counts['unknown'] += 1
+            return None
+
+        self.counts[change['change']] += 1
+        self.write(change)
+        return change
+
+    def write(self, change):
+        if self.file is None:
+            if self.output_dir:
+                os.makedirs(self.output_dir, exist_ok=True)
+            self.file = open(self.delta_file, 'w', encoding='utf-8')
+        self.file.write(json.dumps(change, ensure_ascii=False) + '\n')
+
+    def finish(self):
+        """Save the snapshot and close the delta; returns the delta path, or None when nothing changed"""
+        if self.file:
+            self.file.close()
+        self.snapshot.save()
+        return self.delta_file if self.file else None
+
+    def describe(self):
+        return ', '.join(f"{count} {kind}" for kind, count in self.counts.items())
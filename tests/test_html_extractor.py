@@ -0,0 +1,112 @@
+"""
+Parity of the single-pass HTML extractor with the BeautifulSoup reference
+(AjaxPANScraper.parse_html_with_soup) on hand-written and random markup
+"""
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ajax_scraper import AjaxPANScraper
+from html_extractor import extract_html_records
+
+PAN = '300000001'
+
+PORTAL_PAGE = """<html>
+<body>
+    <div class="menu"><ul>
+        <li><a href="#">Home</a></li>
+    </ul></div>
+    <h3>PAN Details</h3>
+    <table class="table">
+        <tr>
+            <th>Office</th>
+            <td>IRO Kathmandu</td>
+        </tr>
+        <tr>
+            <th>PAN</th>
+            <td>300000001</td>
+        </tr>
+        <tr>
+            <th>Name</th>
+            <td>Trader &amp; Sons Pvt. Ltd.</td>
+        </tr>
+        <tr><th>Ward</th>	<td>4</td></tr>
+    </table>
+    <h3>Registration Details</h3>
+    <table>
+        <tr><th>Type</th><th>Reg. Date</th><th>Status</th></tr>
+        <tr>	<td>VAT</td>	<td>2070.01.01</td>	<td>Active</td>	</tr>
+    </table>
+    <h3>Latest Tax Clearance</h3>
+</body>
+</html>
+"""
+
+CASES = {
+    'indented rows': '<h3>Registration Details</h3><table>\n\t<tr>\t<td>VAT</td>\t<td>2070.01.01</td>\t<td>Active</td>\t</tr></table>',
+    'tab between tags': 'PAN Details\nName<table>\t</p>PAN No',
+    'tab separated text': 'PAN Details\nName\tTrader\nWard\t4\nRegistration Details\nVAT\t2070.01.01\tActive\n',
+    'portal page': PORTAL_PAGE,
+    'crlf page': PORTAL_PAGE.replace('\n', '\r\n'),
+    'nested tables': ('<table><tr><td>Office</td><td><table><tr><td>Name</td><td>Inner</td></tr></table>'
+                      '</td></tr>\n  <tr><td>City Name</td><td> Pokhara </td></tr></table>'),
+    'unclosed cells': '<table><tr><th>PAN<td>300000001<tr><th>Name<td>Trader\n  <td>Extra</table>',
+    'stray end tags': '</td></tr><table></p><tr><td>Office</span></td><td>IRO</div> Lalitpur</td></tr></table></table>',
+    'preformatted whitespace': 'PAN Details\n<pre>\t</pre>Name<pre>  \n</pre>\tTrader<textarea> \t</textarea>',
+    'void end tags': 'PAN Details\nName<br>\t</br>\tTrader<br/></br>\n<table><tr><td>Ward<br></br> 4</td><td>4</td></tr></table>',
+    'skipped text': 'PAN Details\n<script>Name\tHidden</script>Name\t<style>x</style>Shown<template>\t</template>',
+    'comments and cdata': 'PAN Details\nName<!-- c -->\t<![CDATA[ Trader\t]]>\nWard\t<?pi?>4<!DOCTYPE html>',
+    'references': ('PAN Details\nName\t&amp;&amp &lt;&foo;&#65;&#x42;&#12a&#xZZ;&#128;&#0;\n'
+                   '<table><tr><td>Office</td><td>&nbsp;IRO&notit;</td></tr></table>'),
+}
+
+# Pieces of markup the random documents are built from
+PIECES = [
+    '<table>', '</table>', '<tr>', '</tr>', '<td>', '</td>', '<th>', '</th>', '<tbody>', '</tbody>', '<p>', '</p>',
+    '<div>', '</div>', '<span>', '</span>', '<pre>', '</pre>', '<textarea>', '</textarea>', '<br>', '<br/>', '</br>',
+    '<TD class="x">', '<td/>', '<script>x\t1</script>', '<style>a</style>', '<!-- c -->', '<![CDATA[ cd\t]]>',
+    '<!DOCTYPE html>', '<?pi?>', '\n', '\t', ' ', '\r\n', '  \t ', '\x0c', '\xa0', 'PAN Details', 'Registration Details',
+    'Latest Tax Clearance', 'Name', 'PAN No', 'PAN', 'Office', 'Ward', 'City', 'Street', 'Telephone', 'Type', 'Status',
+    'VAT', '2070.01.01', 'Active', '&amp;', '&amp', '&lt;', '&nbsp;', '&foo;', '&#65;', '&#x42;', '&#128;', '&#12a',
+    '&', '<', '>', 'a < b',
+]
+
+
+class HtmlExtractorParityTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.scraper = AjaxPANScraper()
+
+    def assert_parity(self, content):
+        pan_details = self.scraper.get_empty_pan_details(PAN)
+        registration_details = []
+        extract_html_records(content, pan_details, registration_details, PAN)
+        self.assertEqual(self.scraper.parse_html_with_soup(content, PAN), (pan_details, registration_details),
+                         repr(content))
+
+    def test_markup_cases(self):
+        for name, content in CASES.items():
+            with self.subTest(name):
+                self.assert_parity(content)
+
+    def test_portal_page_records(self):
+        pan_details = self.scraper.get_empty_pan_details(PAN)
+        registration_details = []
+        extract_html_records(PORTAL_PAGE, pan_details, registration_details, PAN)
+        self.assertEqual(pan_details['Name'], 'Trader & Sons Pvt. Ltd.')
+        self.assertEqual(pan_details['Ward'], '4')
+        self.assertEqual(registration_details, [])
+
+    def test_random_documents(self):
+        rng = random.Random(31)
+        for _ in range(3000):
+            content = ''.join(rng.choice(PIECES) for _ in range(rng.randint(1, 40)))
+            self.assert_parity(content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Durable shared work queue for distributed batches
+PANs live in a SQLite file that coordinator and workers on several nodes open
+(via a shared filesystem). Workers lease PANs for a limited time and renew the
+lease while they work; a lease that runs out (crashed or stalled worker) makes
+its PANs available again, so every PAN is looked up at least once
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    batch TEXT NOT NULL,
+    pan TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    result TEXT,
+    finished REAL,
+    PRIMARY KEY (batch, pan)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (batch, state, lease_expires);
+"""
+
+# A PAN whose lease has run out this many times (it keeps taking workers down) is closed as failed
+MAX_ATTEMPTS = 5
+
+
+class WorkQueue:
+    def __init__(self, path, lease_seconds=120, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # One connection per process, shared by its threads; other processes are kept out by SQLite's file locks
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction; IMMEDIATE takes the write lock up front so two nodes never lease the same rows"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def enqueue(self, pans, batch='default'):
+        """Add PANs to a batch; PANs already in it are left as they are. Returns the number added"""
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO tasks (batch, pan) VALUES (?, ?)",
+                             ((batch, str(pan).strip()) for pan in pans))
+            return conn.total_changes - before
+
+    def lease(self, worker, count, batch='default'):
+        """Lease up to `count` PANs: pending ones first, then ones whose lease has expired"""
+        now = time.time()
+        with self.transaction() as conn:
+            # Expired leases that used up their attempts are closed instead of handed out again
+            conn.execute("UPDATE tasks SET state = 'done', finished = ?, result = ? "
+                         "WHERE batch = ? AND state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (now, json.dumps({'success': False, 'message': 'Lease expired too many times'}),
+                          batch, now, self.max_attempts))
+            pans = [row[0] for row in conn.execute(
+                "SELECT pan FROM tasks WHERE batch = ? AND (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) "
+                "ORDER BY state = 'leased', rowid LIMIT ?", (batch, now, count))]
+            conn.executemany("UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                             "WHERE batch = ? AND pan = ?",
+                             ((worker, now + self.lease_seconds, batch, pan) for pan in pans))
+        return pans
+
+    def renew(self, worker, pans, batch='default'):
+        """Extend this worker's leases on PANs it is still working on"""
+        expires = time.time() + self.lease_seconds
+        with self.transaction() as conn:
+            conn.executemany("UPDATE tasks SET lease_expires = ? "
+                             "WHERE batch = ? AND pan = ? AND worker = ? AND state = 'leased'",
+                             ((expires, batch, pan, worker) for pan in pans))
+
+    def complete(self, worker, pan, result, batch='default'):
+        """Store a PAN's result; the first result stored wins when a PAN was looked up twice"""
+        with self.transaction() as conn:
+            cursor = conn.execute("UPDATE tasks SET state = 'done', worker = ?, finished = ?, result = ? "
+                                  "WHERE batch = ? AND pan = ? AND state != 'done'",
+                                  (worker, time.time(), json.dumps(result, ensure_ascii=False, default=str),
+                                   batch, pan))
+            return cursor.rowcount > 0
+
+    def release(self, worker, pan, batch='default', result=None):
+        """Hand a leased PAN back (e.g. the portal was unavailable) so it is retried later; once it has
+        used up its attempts it is completed with `result` instead"""
+        with self.transaction() as conn:
+            if result is not None:
+                conn.execute("UPDATE tasks SET state = 'done', worker = ?, finished = ?, result = ? "
+                             "WHERE batch = ? AND pan = ? AND worker = ? AND state = 'leased' AND attempts >= ?",
+                             (worker, time.time(), json.dumps(result, ensure_ascii=False, default=str),
+                              batch, pan, worker, self.max_attempts))
+            conn.execute("UPDATE tasks SET state = 'pending', worker = NULL, lease_expires = NULL "
+                         "WHERE batch = ? AND pan = ? AND worker = ? AND state = 'leased'", (batch, pan, worker))
+
+    def status(self, batch='default'):
+        """Counts per state; leased PANs whose lease has run out are counted as 'expired'"""
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT CASE WHEN state = 'leased' AND lease_expires < ? THEN 'expired' ELSE state END, COUNT(*) "
+                "FROM tasks WHERE batch = ? GROUP BY 1", (now, batch)).fetchall()
+            workers = self.conn.execute(
+                "SELECT COUNT(DISTINCT worker) FROM tasks WHERE batch = ? AND state = 'leased' AND lease_expires >= ?",
+                (batch, now)).fetchone()[0]
+        counts = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0}
+        counts.update(rows)
+        counts['workers'] = workers
+        return counts
+
+    def is_finished(self, batch='default'):
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM tasks WHERE batch = ? AND state != 'done' LIMIT 1",
+                                    (batch,)).fetchone()
+        return row is None
+
+    def results(self, batch='default'):
+        """(pan, result) for every finished PAN, in queue order"""
+        with self.lock:
+            rows = self.conn.execute("SELECT pan, result FROM tasks WHERE batch = ? AND state = 'done' ORDER BY rowid",
+                                     (batch,)).fetchall()
+        for pan, result in rows:
+            yield pan, json.loads(result)
+
+    def describe(self, batch='default'):
+        counts = self.status(batch)
+        return (f"{counts['done']} done, {counts['leased']} leased by {counts['workers']} worker(s), "
+                f"{counts['pending']} pending, {counts['expired']} with expired leases")
+
+    def close(self):
+        self.conn.close()